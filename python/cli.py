@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# author: Joschka Hüllmann <huellmann@uni-muenster.de>
+
+""" cli.py: This module is the single command line entry point for the python scripts. Each
+            subcommand runs one of the scripts with configurable paths:
+
+            extract    ol_extract.py, extracts the emails of a pst file via pypff.
+            transform  ol_transform.py, parses the output of pffexport.
+            resolve    ol_transform.py, resolves legacyExchangeDns in a csv file written
+                       by transform --no-resolve.
+            mbox       mbox_extract.py, extracts the csv overview from Thunderbird mbox files.
+            anonymize  transform.py, anonymizes csv overview files.
+            lookup     mapping_index.py, looks up ids or addresses in the mapping index.
+
+            The scripts are only imported by the subcommand that needs them, so that pypff,
+            numpy and scipy are neither loaded nor required by the other subcommands.
+"""
+
+import argparse
+import sys
+
+
+def run_extract(args):
+  """ Runs the extract subcommand. """
+  import ol_extract
+  ol_extract.main(args.pst_file, args.output,
+                  tuple(args.inbox) if args.inbox is not None else ol_extract.TARGETS_INBOX,
+                  tuple(args.sent) if args.sent is not None else ol_extract.TARGETS_SENT)
+
+
+def run_transform(args):
+  """ Runs the transform subcommand. """
+  import ol_transform
+  ol_transform.main(args.root_folder,
+                    tuple(args.sent) if args.sent is not None else ol_transform.TARGETS_SENT,
+                    tuple(args.inbox) if args.inbox is not None else ol_transform.TARGETS_INBOX,
+                    args.output, not args.no_resolve, args.lookup)
+
+
+def run_resolve(args):
+  """ Runs the resolve subcommand. """
+  import ol_transform
+  ol_transform.resolve_csv(args.file, args.outfile, args.lookup)
+
+
+def run_mbox(args):
+  """ Runs the mbox subcommand. """
+  import mbox_extract
+  mbox_extract.main(args.root_folder, args.output, args.incremental)
+
+
+def run_anonymize(args):
+  """ Runs the anonymize subcommand. """
+  import transform
+  if args.period is not None and args.period not in transform.PERIOD_LENGTHS:
+    raise SystemExit("unknown period: %s (choose from %s)" % (args.period, ", ".join(sorted(transform.PERIOD_LENGTHS))))
+  try:
+    since = transform.parse_time(args.since) if args.since is not None else None
+    until = transform.parse_time(args.until) if args.until is not None else None
+  except ValueError as e:
+    raise SystemExit(str(e))
+  row_filter = transform.make_row_filter(since, until, args.include, args.exclude)
+  transform.main(args.aggregate, args.period, args.matrix, args.files if len(args.files) > 0 else None, args.output, row_filter)
+
+
+def run_lookup(args):
+  """ Runs the lookup subcommand. """
+  import mapping_index
+  if mapping_index.lookup(args.index, args.queries) > 0:
+    raise SystemExit(1)
+
+
+def build_parser():
+  """ Builds the argument parser with one subparser per subcommand.
+
+      Return:
+        The argument parser. """
+  parser = argparse.ArgumentParser(description="Extracts and anonymizes email metadata.")
+  subparsers = parser.add_subparsers(dest="command", metavar="command")
+  subparsers.required = True
+
+  extract = subparsers.add_parser("extract", help="extract the emails of a pst file via pypff")
+  extract.add_argument("pst_file", nargs="?", default="backup.pst", help="the pst file (default: backup.pst)")
+  extract.add_argument("--output", default=".", help="the folder to write the csv files to")
+  extract.add_argument("--inbox", action="append", help="path of an inbox folder in the pst file, can be repeated")
+  extract.add_argument("--sent", action="append", help="path of a sent folder in the pst file, can be repeated")
+  extract.set_defaults(func=run_extract)
+
+  transform = subparsers.add_parser("transform", help="parse the output of pffexport")
+  transform.add_argument("root_folder", nargs="?", default="backup.pst.export", help="the pffexport tree or a tar or zip archive of it (default: backup.pst.export)")
+  transform.add_argument("--output", default=".", help="the folder to write the csv files to")
+  transform.add_argument("--inbox", action="append", help="inbox folder relative to the root folder, can be repeated")
+  transform.add_argument("--sent", action="append", help="sent folder relative to the root folder, can be repeated")
+  transform.add_argument("--no-resolve", action="store_true", help="do not resolve legacyExchangeDns, see the resolve command")
+  transform.add_argument("--lookup", default="active-directory.csv", help="the active directory lookup file")
+  transform.set_defaults(func=run_transform)
+
+  resolve = subparsers.add_parser("resolve", help="resolve legacyExchangeDns in a csv file")
+  resolve.add_argument("file", help="the csv file written by transform --no-resolve")
+  resolve.add_argument("outfile", help="the output csv file")
+  resolve.add_argument("--lookup", default="active-directory.csv", help="the active directory lookup file")
+  resolve.set_defaults(func=run_resolve)
+
+  mbox = subparsers.add_parser("mbox", help="extract the csv overview from Thunderbird mbox files")
+  mbox.add_argument("root_folder", help="the folder to look for mbox files, e.g. the Mail folder of a profile")
+  mbox.add_argument("--output", default=".", help="the folder to write the csv files to")
+  mbox.add_argument("--incremental", action="store_true", help="keep an index per mbox file next to its csv file and only add newly appended messages")
+  mbox.set_defaults(func=run_mbox)
+
+  anonymize = subparsers.add_parser("anonymize", help="anonymize csv overview files")
+  anonymize.add_argument("files", nargs="*", help="the csv files (default: all *.csv files in the current directory)")
+  anonymize.add_argument("--output", default="anon", help="the folder to store the results in (default: anon)")
+  anonymize.add_argument("--aggregate", action="store_true", help="write the weighted edge list instead of single edges")
+  anonymize.add_argument("--period", help="count messages per year, month or day in the weighted edge list")
+  anonymize.add_argument("--matrix", action="store_true", help="save the sparse sender x recipient matrix as adjacency.npz")
+  anonymize.add_argument("--since", help="only keep rows from this time on, e.g. 2015-01-01")
+  anonymize.add_argument("--until", help="only keep rows before this time")
+  anonymize.add_argument("--include", action="append", default=[], help="only keep rows involving this address or domain, can be repeated")
+  anonymize.add_argument("--exclude", action="append", default=[], help="skip rows involving this address or domain, can be repeated")
+  anonymize.set_defaults(func=run_anonymize)
+
+  lookup = subparsers.add_parser("lookup", help="look up ids or addresses in the mapping index")
+  lookup.add_argument("queries", nargs="+", metavar="id_or_address", help="an anonymous id or an address")
+  lookup.add_argument("--index", default="anon/mapping.idx", help="the mapping index (default: anon/mapping.idx)")
+  lookup.set_defaults(func=run_lookup)
+
+  return parser
+
+
+def main(argv=None):
+  """ The main function that runs this program. Parses the arguments and runs the subcommand.
+
+      Args:
+        argv: The list of arguments, by default sys.argv[1:]. """
+  args = build_parser().parse_args(sys.argv[1:] if argv is None else argv)
+  args.func(args)
+
+
+if __name__ == "__main__":
+  """ magic main. """
+  main()
@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# author: Joschka Hüllmann <huellmann@uni-muenster.de>
+
+import unittest
+
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+
+import cli
+
+class TestCliMethods(unittest.TestCase):
+
+  def test_build_parser(self):
+    args = cli.build_parser().parse_args(["transform", "export", "--sent", "Top/Sent Items", "--sent", "Top/Outbox", "--no-resolve"])
+    self.assertEqual(args.func, cli.run_transform)
+    self.assertEqual(args.root_folder, "export")
+    self.assertEqual(args.sent, ["Top/Sent Items", "Top/Outbox"])
+    self.assertIsNone(args.inbox)
+    self.assertTrue(args.no_resolve)
+    args = cli.build_parser().parse_args(["anonymize"])
+    self.assertEqual((args.files, args.output), ([], "anon"))
+    self.assertRaises(SystemExit, cli.build_parser().parse_args, [])
+
+  def test_lazy_imports(self):
+    # parsing the arguments must not load any of the scripts or their dependencies
+    code = "import sys, cli; cli.build_parser().parse_args(['anonymize']); " \
+           "print(','.join(m for m in ('pypff', 'pytz', 'numpy', 'scipy', 'unicodecsv', 'transform', 'ol_transform', 'ol_extract') if m in sys.modules))"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)))
+    self.assertEqual(output.strip(), b"")
+
+  def test_anonymize(self):
+    try:
+      os.makedirs("cli_test.temp")
+      with open(os.path.join("cli_test.temp", "in.csv"), "w") as fp:
+        fp.write('"a","x@y.de","p@q.de",2015-01-01 10:00:00\n')
+      cli.main(["anonymize", os.path.join("cli_test.temp", "in.csv"), "--output", os.path.join("cli_test.temp", "out")])
+      self.assertTrue(os.path.isfile(os.path.join("cli_test.temp", "out", "in.csv.anon.csv")))
+      self.assertTrue(os.path.isfile(os.path.join("cli_test.temp", "out", "mapping.csv")))
+      self.assertRaises(SystemExit, cli.main, ["anonymize", "--aggregate", "--period", "week"])
+    finally:
+      shutil.rmtree("cli_test.temp")
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,193 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# author: Joschka Hüllmann <huellmann@uni-muenster.de>
+
+""" mapping_index.py: This module writes and reads a compact index of the mapping from email address
+                      to anonymous id created by transform.py, so that single addresses or ids can be
+                      looked up in both directions without scanning mapping.csv. The index is memory
+                      mapped and searched binary, only a few pages are read per lookup.
+
+                      The index file consists of little-endian unsigned 64 bit integers:
+                      MAGIC, N                header, MAGIC is the 8 bytes IETMAP01
+                      IDS[N]                  the ids in ascending order
+                      OFFSETS[N+1]            start of the address of each id in the addresses block
+                      ORDER[N]                positions in IDS sorted by the utf-8 bytes of the address
+                      followed by the utf-8 encoded addresses in the order of IDS.
+
+                      Run as script to look up ids or addresses:
+                      mapping_index.py anon/mapping.idx 48213 user@web.de
+"""
+
+import array
+import bisect
+import csv
+import mmap
+import struct
+import sys
+
+
+MAGIC = b"IETMAP01"
+
+HEADER = struct.Struct("<8sQ")
+
+UINT64 = struct.Struct("<Q")
+
+
+def write_array(fp, values):
+  """ Writes integers as little-endian unsigned 64 bit integers.
+
+      Args:
+        fp: The file to write to.
+        values: An iterable of integers, it is filled into an array without an intermediate list.
+      Return:
+        Nothing. """
+  data = array.array("Q", values)
+  if sys.byteorder == "big":
+    data.byteswap()
+  data.tofile(fp)
+
+
+def write_mapping_index(mapping, filename):
+  """ Writes the index of a mapping. The mapping can have tens of millions of entries, so the
+      index is built without per entry tuples or encoded copies of the addresses: only the
+      addresses sorted by id are kept as list, the integers are filled into arrays directly.
+      The order of python strings equals the order of their utf-8 bytes, so the addresses are
+      sorted without encoding them.
+
+      Args:
+        mapping: The mapping to index. It is a hashmap with key being email and value
+                 being the anonymized id.
+        filename: The filename of the index.
+      Return:
+        Nothing. """
+  addresses = sorted(mapping, key=mapping.__getitem__)
+  ids = array.array("Q", map(mapping.__getitem__, addresses))
+  offsets = array.array("Q", [0])
+  offset = 0
+  for address in addresses:
+    offset = offset + len(address.encode("utf-8"))
+    offsets.append(offset)
+  with open(filename, "wb") as wp:
+    wp.write(HEADER.pack(MAGIC, len(addresses)))
+    write_array(wp, ids)
+    write_array(wp, offsets)
+    del offsets
+    # the position of an address in IDS is found by the binary search of its id
+    write_array(wp, (bisect.bisect_left(ids, mapping[address]) for address in sorted(mapping)))
+    for address in addresses:
+      wp.write(address.encode("utf-8"))
+
+
+class MappingIndex(object):
+  """ Read access to an index written by `write_mapping_index(mapping, filename)`. """
+
+  def __init__(self, filename):
+    """ Opens and maps the index.
+
+        Args:
+          filename: The filename of the index. """
+    with open(filename, "rb") as fp:
+      self.mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, self.count = HEADER.unpack_from(self.mm, 0)
+    if magic != MAGIC:
+      self.mm.close()
+      raise ValueError("Not a mapping index: %s" % filename)
+    self.ids_start = HEADER.size
+    self.offsets_start = self.ids_start + 8 * self.count
+    self.order_start = self.offsets_start + 8 * (self.count + 1)
+    self.addresses_start = self.order_start + 8 * self.count
+
+  def __len__(self):
+    return self.count
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def close(self):
+    """ Closes the index. """
+    self.mm.close()
+
+  def _uint64(self, start, i):
+    return UINT64.unpack_from(self.mm, start + 8 * i)[0]
+
+  def _address(self, i):
+    start = self._uint64(self.offsets_start, i)
+    end = self._uint64(self.offsets_start, i + 1)
+    return self.mm[self.addresses_start + start:self.addresses_start + end]
+
+  def get_address(self, anon_id):
+    """ Looks up the address of an anonymous id.
+
+        Args:
+          anon_id: The anonymous id.
+        Return:
+          The address, or None if the id is unknown. """
+    low, high = 0, self.count
+    while low < high:
+      middle = (low + high) // 2
+      if self._uint64(self.ids_start, middle) < anon_id:
+        low = middle + 1
+      else:
+        high = middle
+    if low < self.count and self._uint64(self.ids_start, low) == anon_id:
+      return self._address(low).decode("utf-8")
+    return None
+
+  def get_id(self, address):
+    """ Looks up the anonymous id of an address. Addresses are compared lowercase, as they
+        are stored in the mapping.
+
+        Args:
+          address: The address.
+        Return:
+          The anonymous id, or None if the address is unknown. """
+    key = address.strip().lower().encode("utf-8")
+    low, high = 0, self.count
+    while low < high:
+      middle = (low + high) // 2
+      if self._address(self._uint64(self.order_start, middle)) < key:
+        low = middle + 1
+      else:
+        high = middle
+    if low < self.count:
+      i = self._uint64(self.order_start, low)
+      if self._address(i) == key:
+        return self._uint64(self.ids_start, i)
+    return None
+
+
+def lookup(filename, queries):
+  """ Looks up a list of ids or addresses and prints the results as csv rows id,address.
+      Queries of ascii digits are taken as ids and, if there is no such id, as addresses. All
+      other queries are taken as addresses. Unknown queries are printed with an empty counterpart.
+
+      Args:
+        filename: The filename of the index.
+        queries: The list of ids or addresses.
+      Return:
+        The number of unknown queries. """
+  unknown = 0
+  writer = csv.writer(sys.stdout, lineterminator="\n")
+  with MappingIndex(filename) as index:
+    for query in queries:
+      address = None
+      if query.isascii() and query.isdigit():
+        address = index.get_address(int(query))
+      if address is not None:
+        writer.writerow([query, address])
+      else:
+        anon_id = index.get_id(query)
+        writer.writerow([anon_id if anon_id is not None else "", query])
+        unknown = unknown + (anon_id is None)
+  return unknown
+
+
+if __name__ == "__main__":
+  """ magic main. """
+  if len(sys.argv) < 3:
+    print("usage: mapping_index.py INDEX ID_OR_ADDRESS...")
+    sys.exit(2)
+  sys.exit(1 if lookup(sys.argv[1], sys.argv[2:]) > 0 else 0)
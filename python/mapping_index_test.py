@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# author: Joschka Hüllmann <huellmann@uni-muenster.de>
+
+import unittest
+
+import contextlib
+import io
+import os
+import random
+
+import mapping_index
+
+class TestMappingIndexMethods(unittest.TestCase):
+
+  def tearDown(self):
+    if os.path.exists("mapping_index_test.idx.temp"):
+      os.remove("mapping_index_test.idx.temp")
+
+  def test_lookup(self):
+    rng = random.Random(42)
+    mapping = {"user@web.de": 2, "mailbot@comunio.de": 1, "grüße@web.de": 3, "undisclosed-recipients": 4, "": 5}
+    for i in range(6, 2000):
+      mapping["".join(rng.choice("abcxyz.-") for _ in range(rng.randrange(1, 12))) + "%d@web.de" % i] = i
+    mapping_index.write_mapping_index(mapping, "mapping_index_test.idx.temp")
+
+    with mapping_index.MappingIndex("mapping_index_test.idx.temp") as index:
+      self.assertEqual(len(index), len(mapping))
+      for address, anon_id in mapping.items():
+        self.assertEqual(index.get_id(address), anon_id)
+        self.assertEqual(index.get_address(anon_id), address)
+      self.assertEqual(index.get_id(" User@Web.de "), 2)
+      self.assertIsNone(index.get_id("unknown@web.de"))
+      self.assertIsNone(index.get_id("zzz"))
+      self.assertIsNone(index.get_address(0))
+      self.assertIsNone(index.get_address(2000))
+
+  def test_lookup_queries(self):
+    mapping_index.write_mapping_index({"user@web.de": 1, "\"mann, user\"@web.de": 2, "12345": 3}, "mapping_index_test.idx.temp")
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+      unknown = mapping_index.lookup("mapping_index_test.idx.temp", ["1", "2", "12345", "\u00b2", "4"])
+    self.assertEqual(unknown, 2)
+    self.assertEqual(output.getvalue().splitlines(),
+      ["1,user@web.de", "2,\"\"\"mann, user\"\"@web.de\"", "3,12345", ",\u00b2", ",4"])
+
+  def test_empty(self):
+    mapping_index.write_mapping_index({}, "mapping_index_test.idx.temp")
+    with mapping_index.MappingIndex("mapping_index_test.idx.temp") as index:
+      self.assertEqual(len(index), 0)
+      self.assertIsNone(index.get_id("user@web.de"))
+      self.assertIsNone(index.get_address(1))
+
+  def test_invalid(self):
+    with open("mapping_index_test.idx.temp", "wb") as fp:
+      fp.write(b"mailbot@comunio.de,1\n")
+    self.assertRaises(ValueError, mapping_index.MappingIndex, "mapping_index_test.idx.temp")
+
+if __name__ == '__main__':
+  unittest.main()
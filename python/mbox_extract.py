@@ -0,0 +1,264 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# author: Joschka Hüllmann <huellmann@uni-muenster.de>
+
+""" mbox_extract.py: This module reads the mbox files of a Thunderbird profile directly and writes
+                     a csv file per mail folder in the same format as the csv overview exported by
+                     the addon, so that it can be anonymized with transform.py without running
+                     Thunderbird. Only the header block of each message is read and parsed, the
+                     bodies are skipped line by line without being kept in memory.
+
+                     The structure of the written csv files is given as (without headers):
+                     SUBJECT,SOURCE,TARGET,TIME
+"""
+
+import email
+import email.errors
+import email.header
+import email.parser
+import email.utils
+import os
+import os.path
+import sys
+from datetime import datetime, timezone
+import unicodecsv as csv
+
+import mbox_index
+
+
+# Format of the TIME column, the same as written by the addon.
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Format of the date in the "From " separator line.
+SEPARATOR_TIME_FORMAT = "%a %b %d %H:%M:%S %Y"
+
+# Thunderbird keeps deleted messages in the mbox file until the folder is compacted.
+MOZILLA_STATUS_EXPUNGED = 0x0008
+
+# Files in the Mail folder of a profile that are never mbox files.
+SKIPPED_EXTENSIONS = (".msf", ".dat", ".json", ".html", ".sqlite")
+
+
+def is_mbox_file(filename):
+  """ Checks whether a file is a mbox file, i.e. it starts with a "From " separator line.
+
+      Args:
+        filename: The filename to check.
+      Return:
+        True if it is a mbox file, otherwise false. """
+  if filename.endswith(SKIPPED_EXTENSIONS) or not os.path.isfile(filename):
+    return False
+  with open(filename, "rb") as fp:
+    return fp.read(5) == b"From "
+
+
+def find_mbox_files(root_folder):
+  """ Recursively finds all mbox files below the given folder, e.g. the Mail or ImapMail
+      folder of a Thunderbird profile. Subfolders of a mail folder are stored in the
+      directory <name>.sbd next to the mbox file <name>.
+
+      Args:
+        root_folder: The folder to start looking into.
+      Return:
+        A sorted list of mbox filenames. """
+  mbox_files = []
+  for dirpath, _, filenames in os.walk(root_folder):
+    for filename in filenames:
+      if is_mbox_file(os.path.join(dirpath, filename)):
+        mbox_files.append(os.path.join(dirpath, filename))
+  return sorted(mbox_files)
+
+
+def read_mbox_headers(filename):
+  """ Streams the header blocks of all messages of a mbox file. A message starts with a
+      "From " separator line at the start of the file or after an empty line, its header
+      block ends with the first empty line. All following lines up to the next separator
+      are body lines and are skipped.
+
+      Args:
+        filename: The filename of the mbox file.
+      Return:
+        A generator of 2-tuples consisting of separator line and header block, both as bytes. """
+  with open(filename, "rb") as fp:
+    separator = None
+    header_lines = []
+    in_headers = False
+    previous_empty = True
+    for line in fp:
+      empty = line in (b"\n", b"\r\n")
+      if previous_empty and line.startswith(b"From "):
+        if separator is not None:
+          yield separator, b"".join(header_lines)
+        separator = line
+        header_lines = []
+        in_headers = True
+      elif in_headers:
+        if empty:
+          in_headers = False
+        else:
+          header_lines.append(line)
+      previous_empty = empty
+    if separator is not None:
+      yield separator, b"".join(header_lines)
+
+
+def decode_header_value(value):
+  """ Decodes a header value that may contain RFC 2047 encoded words.
+
+      Args:
+        value: The raw header value or None.
+      Return:
+        The decoded header value, an empty string if the value is None. """
+  if value is None:
+    return ""
+  try:
+    return str(email.header.make_header(email.header.decode_header(value)))
+  except (UnicodeDecodeError, LookupError, email.errors.HeaderParseError):
+    return str(value)
+
+
+def unfold_header_value(value):
+  """ Unfolds a header value without decoding RFC 2047 encoded words. Address headers are kept
+      encoded, because decoding them drops the quoting of display names like "Lastname,
+      Firstname" and transform.py decodes them itself per address. Raw 8-bit values are
+      decoded as utf-8.
+
+      Args:
+        value: The raw header value or None.
+      Return:
+        The unfolded header value, an empty string if the value is None. """
+  if value is None:
+    return ""
+  if isinstance(value, email.header.Header):
+    value = "".join(part.decode("utf-8", "replace") if isinstance(part, bytes) else part
+                    for part, _ in email.header.decode_header(value))
+  return str(value).replace("\r", "").replace("\n", "")
+
+
+def get_format_date(datestr, separator):
+  """ Parses the date header of a message and formats it as an UTC string. If the date header is
+      missing or cannot be parsed, the date of the "From " separator line is used instead.
+
+      Args:
+        datestr: The value of the date header or None.
+        separator: The "From " separator line of the message as bytes.
+      Return:
+        A date formatted string in the form of 2019-02-06 09:41:44 in UTC, or an empty string
+        if no date could be found. """
+  dt = None
+  if datestr is not None:
+    try:
+      dt = email.utils.parsedate_to_datetime(str(datestr))
+    except (TypeError, ValueError, IndexError):
+      dt = None
+  if dt is None:
+    try:
+      dt = datetime.strptime(" ".join(separator.decode("ascii", "replace").split()[-5:]), SEPARATOR_TIME_FORMAT)
+    except ValueError:
+      return ""
+  if dt.tzinfo is None:
+    dt = dt.replace(tzinfo=timezone.utc)
+  return dt.astimezone(timezone.utc).strftime(TIME_FORMAT)
+
+
+def create_row(separator, header_block):
+  """ Creates a row entry out of the header block of a message, which includes subject,
+      source, recipients and time. The recipients are the To and Cc addresses.
+
+      Args:
+        separator: The "From " separator line of the message as bytes.
+        header_block: The header block of the message as bytes.
+      Return:
+        A list consisting of subject, from, recipients, date, or None if the message
+        is marked as deleted. """
+  headers = email.parser.BytesParser().parsebytes(header_block, True)
+  try:
+    if int(headers.get("X-Mozilla-Status", "0"), 16) & MOZILLA_STATUS_EXPUNGED:
+      return None
+  except ValueError:
+    pass
+  to = unfold_header_value(headers["To"])
+  cc = unfold_header_value(headers["Cc"])
+  # We only need comma if both are not empty
+  recipients = to + "," + cc if len(to) > 0 and len(cc) > 0 else to + cc
+  return [decode_header_value(headers["Subject"]).replace("\r\n", "").replace("\n", ""),
+          unfold_header_value(headers["From"]),
+          recipients,
+          get_format_date(headers["Date"], separator)]
+
+
+def process_mbox(filename, outfile, incremental=False):
+  """ Writes the rows of all messages of a mbox file to the given csv file. In incremental mode
+      the index <csv>.idx next to the csv file is used to append only the rows of messages that
+      were added since the last run. If the mbox file was rewritten, e.g. by compaction, or the
+      csv file does not exist, all rows are written. The index is saved after the csv file.
+
+      Args:
+        filename: The filename of the mbox file.
+        outfile: The output filename.
+        incremental: If true, the index is used and updated.
+      Return:
+        The number of written rows. """
+  if incremental:
+    index_filename = mbox_index.get_index_name(outfile)
+    size, entries, first_new = mbox_index.build_index(filename, mbox_index.load_index(index_filename))
+    if not os.path.isfile(outfile):
+      first_new = 0
+    mode = "ab" if first_new > 0 else "wb"
+    messages = mbox_index.read_headers(filename, entries[first_new:])
+  else:
+    mode = "wb"
+    messages = read_mbox_headers(filename)
+
+  count = 0
+  with open(outfile, mode) as wp:
+    writer = csv.writer(wp, delimiter=',', quotechar='"')
+    for separator, header_block in messages:
+      row = create_row(separator, header_block)
+      if row is None:
+        continue
+      writer.writerow(row)
+      count = count + 1
+
+  if incremental:
+    mbox_index.save_index(index_filename, size, entries)
+  return count
+
+
+def get_csv_name(root_folder, filename):
+  """ Derives the name of the output csv file from the path of the mbox file relative to the
+      root folder, e.g. Inbox.sbd/Project becomes Inbox.Project.csv.
+
+      Args:
+        root_folder: The root folder of the mbox files.
+        filename: The filename of the mbox file.
+      Return:
+        The name of the csv file. """
+  parts = os.path.relpath(filename, root_folder).split(os.sep)
+  parts = [part[:-len(".sbd")] if part.endswith(".sbd") else part for part in parts]
+  return ".".join(parts) + ".csv"
+
+
+def main(root_folder, output_folder, incremental=False):
+  """ The main function that runs this program. All mbox files below the root folder are
+      converted to csv files in the output folder, which can then be anonymized by running
+      transform.py in the output folder.
+
+      Args:
+        root_folder: The folder to look for mbox files, e.g. the Mail folder of a profile.
+        output_folder: The folder to write the csv files to.
+        incremental: If true, only messages appended since the last run are added to the csv files. """
+  if not os.path.isdir(output_folder):
+    os.makedirs(output_folder)
+  mbox_files = find_mbox_files(root_folder)
+  for filename in mbox_files:
+    outfile = os.path.join(output_folder, get_csv_name(root_folder, filename))
+    count = process_mbox(filename, outfile, incremental)
+    print("extracted %d messages from %s." % (count, filename))
+  print("processed %d mbox files." % len(mbox_files))
+
+
+if __name__ == "__main__":
+  """ magic main. The options are defined by the mbox command of cli.py. """
+  import cli
+  cli.main(["mbox"] + sys.argv[1:])
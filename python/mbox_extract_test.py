@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# author: Joschka Hüllmann <huellmann@uni-muenster.de>
+
+import unittest
+
+import os
+import os.path
+import shutil
+import unicodecsv as csv
+
+import mbox_extract
+import transform
+
+TESTMBOX = b'''From - Wed Jan 07 10:09:00 2015\r
+X-Mozilla-Status: 0001\r
+Subject: =?UTF-8?Q?Gr=C3=BC=C3=9Fe?=\r
+From: "Mann, User" <user@web.de>\r
+To: User1 <user1@web.de>,\r
+ User2 <user2@web.de>\r
+Cc: user3@web.de\r
+Date: Wed, 07 Jan 2015 11:09:00 +0100\r
+\r
+Body line\r
+\r
+>From the body, escaped\r
+\r
+From - Thu Jan 08 12:00:00 2015\r
+X-Mozilla-Status: 0009\r
+Subject: deleted\r
+From: deleted@web.de\r
+To: user@web.de\r
+Date: Thu, 08 Jan 2015 12:00:00 +0000\r
+\r
+Body\r
+\r
+From - Fri Jan 09 13:14:15 2015\r
+Subject: no date\r
+From: mailbot@comunio.de\r
+To: user@web.de\r
+\r
+From - Fri Jan 09 13:14:15 2015\r
+'''
+
+class TestMboxExtractMethods(unittest.TestCase):
+
+  def setUp(self):
+    os.makedirs(os.path.join("mbox_extract_test.temp", "Inbox.sbd"))
+    with open(os.path.join("mbox_extract_test.temp", "Inbox"), "wb") as fp:
+      fp.write(TESTMBOX)
+    with open(os.path.join("mbox_extract_test.temp", "Inbox.msf"), "wb") as fp:
+      fp.write(b"// <!-- <mdb:mork:z v=\"1.4\"/> -->")
+    with open(os.path.join("mbox_extract_test.temp", "Inbox.sbd", "Project"), "wb") as fp:
+      fp.write(TESTMBOX)
+    with open(os.path.join("mbox_extract_test.temp", "Trash"), "wb") as fp:
+      pass
+
+  def tearDown(self):
+    shutil.rmtree("mbox_extract_test.temp")
+
+  def test_find_mbox_files(self):
+    self.assertEqual(mbox_extract.find_mbox_files("mbox_extract_test.temp"),
+      [os.path.join("mbox_extract_test.temp", "Inbox"), os.path.join("mbox_extract_test.temp", "Inbox.sbd", "Project")])
+
+  def test_get_csv_name(self):
+    self.assertEqual(mbox_extract.get_csv_name("mbox_extract_test.temp", os.path.join("mbox_extract_test.temp", "Inbox")), "Inbox.csv")
+    self.assertEqual(mbox_extract.get_csv_name("mbox_extract_test.temp", os.path.join("mbox_extract_test.temp", "Inbox.sbd", "Project")), "Inbox.Project.csv")
+
+  def test_read_mbox_headers(self):
+    messages = list(mbox_extract.read_mbox_headers(os.path.join("mbox_extract_test.temp", "Inbox")))
+    self.assertEqual(len(messages), 4)
+    self.assertEqual(messages[0][0], b"From - Wed Jan 07 10:09:00 2015\r\n")
+    self.assertTrue(messages[0][1].startswith(b"X-Mozilla-Status: 0001\r\n"))
+    self.assertNotIn(b"Body", messages[0][1])
+    self.assertEqual(messages[3][1], b"")
+
+  def test_get_format_date(self):
+    self.assertEqual(mbox_extract.get_format_date("Wed, 07 Jan 2015 11:09:00 +0100", b"From - Thu Jan 01 00:00:00 2015\r\n"), "2015-01-07 10:09:00")
+    self.assertEqual(mbox_extract.get_format_date(None, b"From - Fri Jan 09 13:14:15 2015\r\n"), "2015-01-09 13:14:15")
+    self.assertEqual(mbox_extract.get_format_date("garbage", b"From - Fri Jan 09 13:14:15 2015\r\n"), "2015-01-09 13:14:15")
+    self.assertEqual(mbox_extract.get_format_date(None, b"From -\r\n"), "")
+
+  def test_create_row(self):
+    row = mbox_extract.create_row(b"From - Wed Jan 07 10:09:00 2015\r\n",
+      b"Subject: =?UTF-8?Q?Gr=C3=BC=C3=9Fe?=\r\nFrom: =?UTF-8?Q?M=C3=BCller=2C_Hans?= <h@x.de>\r\n"
+      b"To: =?UTF-8?Q?Mann=2C_User?= <user@web.de>,\r\n =?UTF-8?Q?Frau=2C_User?= <user2@web.de>\r\n")
+    self.assertEqual(row[0], "Grüße")
+    # encoded display names with commas are kept encoded, so that they do not split the address
+    self.assertEqual(transform.split_address(row[1]), ["h@x.de"])
+    self.assertEqual(transform.split_address(row[2]), ["user@web.de", "user2@web.de"])
+
+  def test_integration(self):
+    outfile = os.path.join("mbox_extract_test.temp", "Inbox.csv")
+    self.assertEqual(mbox_extract.process_mbox(os.path.join("mbox_extract_test.temp", "Inbox"), outfile), 3)
+    with open(outfile, "rb") as fp:
+      rows = list(csv.reader(fp, delimiter=',', quotechar='"'))
+    self.assertEqual(rows[0], ["Grüße", '"Mann, User" <user@web.de>', "User1 <user1@web.de>, User2 <user2@web.de>,user3@web.de", "2015-01-07 10:09:00"])
+    self.assertEqual(rows[1], ["no date", "mailbot@comunio.de", "user@web.de", "2015-01-09 13:14:15"])
+    self.assertEqual(rows[2], ["", "", "", "2015-01-09 13:14:15"])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# author: Joschka Hüllmann <huellmann@uni-muenster.de>
+
+""" mbox_index.py: This module maintains a persistent byte-offset index for Thunderbird mbox files.
+                   Mbox files are append-mostly, so the index allows to seek directly to the
+                   messages that were appended since the last run instead of rescanning the whole
+                   file. When Thunderbird compacts a folder, the file is rewritten and the index
+                   is rebuilt.
+
+                   The index is stored in the csv file <csv>.idx next to the csv file written for
+                   the mbox file, so that nothing is written into the profile. The first row is
+                   mbox-index,VERSION,SIZE with the size of the mbox file when it was indexed, each
+                   following row describes one message (without headers):
+                   OFFSET,HEADER_LENGTH,FINGERPRINT
+                   The header length includes the "From " separator line and the fingerprint is
+                   the sha1 of these bytes without the X-Mozilla-* headers, because Thunderbird
+                   rewrites those in place when flags change. Messages deleted without compacting
+                   are therefore only dropped from incremental runs once the folder is compacted.
+"""
+
+import hashlib
+import mmap
+import os
+import os.path
+import unicodecsv as csv
+
+
+INDEX_VERSION = 1
+
+INDEX_EXTENSION = ".idx"
+
+# Schema of an index entry
+OFFSET = 0
+HEADER_LENGTH = 1
+FINGERPRINT = 2
+
+
+def get_index_name(outfile):
+  """ Returns the name of the index file of a mbox file, which is kept next to its csv file.
+
+      Args:
+        outfile: The filename of the csv file written for the mbox file.
+      Return:
+        The filename of the index file. """
+  return outfile + INDEX_EXTENSION
+
+
+def is_separator(mm, start):
+  """ Checks whether the line starting at the given position is a "From " separator line, i.e.
+      it starts with "From " and is at the start of the file or follows an empty line.
+
+      Args:
+        mm: The mapped mbox file.
+        start: The start position of the line.
+      Return:
+        True if it is a separator line, otherwise false. """
+  if mm[start:start + 5] != b"From ":
+    return False
+  if start == 0:
+    return True
+  return mm[max(0, start - 2):start] in (b"\n\n", b"\n") or mm[max(0, start - 3):start] in (b"\n\r\n", b"\r\n")
+
+
+def fingerprint(data):
+  """ Computes the fingerprint of the header bytes of a message. The X-Mozilla-* headers are
+      left out, as they are changed in place by Thunderbird.
+
+      Args:
+        data: The header bytes including the separator line.
+      Return:
+        The fingerprint as hex string. """
+  sha1 = hashlib.sha1()
+  for line in data.splitlines(True):
+    if not line.startswith(b"X-Mozilla-"):
+      sha1.update(line)
+  return sha1.hexdigest()
+
+
+def scan(mm, start, end):
+  """ Locates all messages between the two positions of a mapped mbox file and records their
+      offset, header length and fingerprint. The start position must be the start of a
+      separator line or the end position.
+
+      Args:
+        mm: The mapped mbox file.
+        start: The position to start scanning.
+        end: The position to stop scanning, usually the size of the file.
+      Return:
+        A list of 3-tuples consisting of offset, header length and fingerprint. """
+  offsets = []
+  position = start if start < end and is_separator(mm, start) else -1
+  while position != -1:
+    offsets.append(position)
+    position = mm.find(b"\nFrom ", position + 1, end)
+    while position != -1 and not is_separator(mm, position + 1):
+      position = mm.find(b"\nFrom ", position + 1, end)
+    if position != -1:
+      position = position + 1
+
+  entries = []
+  for i, offset in enumerate(offsets):
+    message_end = offsets[i + 1] if i + 1 < len(offsets) else end
+    # the header block ends with the first empty line
+    header_end = message_end
+    for blank in (b"\n\n", b"\n\r\n"):
+      found = mm.find(blank, offset, message_end)
+      if found != -1 and found + 1 < header_end:
+        header_end = found + 1
+    entries.append((offset, header_end - offset, fingerprint(mm[offset:header_end])))
+  return entries
+
+
+def load_index(index_filename):
+  """ Loads the index of a mbox file.
+
+      Args:
+        index_filename: The filename of the index file.
+      Return:
+        A 2-tuple consisting of the indexed file size and the list of entries, or None
+        if there is no index or it has an unknown version. """
+  if not os.path.isfile(index_filename):
+    return None
+  with open(index_filename, "rb") as fp:
+    reader = csv.reader(fp, delimiter=',', quotechar='"')
+    header = next(reader, None)
+    if header is None or header[0] != "mbox-index" or int(header[1]) != INDEX_VERSION:
+      return None
+    entries = [(int(row[OFFSET]), int(row[HEADER_LENGTH]), row[FINGERPRINT]) for row in reader]
+  return int(header[2]), entries
+
+
+def save_index(index_filename, size, entries):
+  """ Saves the index of a mbox file.
+
+      Args:
+        index_filename: The filename of the index file.
+        size: The size of the mbox file when it was indexed.
+        entries: The list of entries.
+      Return:
+        None. """
+  with open(index_filename, "wb") as wp:
+    writer = csv.writer(wp, delimiter=',', quotechar='"')
+    writer.writerow(["mbox-index", INDEX_VERSION, size])
+    for entry in entries:
+      writer.writerow(entry)
+
+
+def is_unchanged(mm, size, entry):
+  """ Checks whether an indexed message is still at the same position with the same headers.
+
+      Args:
+        mm: The mapped mbox file.
+        size: The current size of the mbox file.
+        entry: The index entry of the message.
+      Return:
+        True if the message is unchanged, otherwise false. """
+  offset, header_length, entry_fingerprint = entry
+  if offset + header_length > size:
+    return False
+  return fingerprint(mm[offset:offset + header_length]) == entry_fingerprint
+
+
+def build_index(filename, previous=None):
+  """ Builds the index of a mbox file. If a previous index is given and the file was only
+      appended to since, only the appended part is scanned. The file is considered rewritten,
+      e.g. by compaction, if it shrank, if the first or last indexed message changed or if the
+      appended part does not start with a separator line. Then the whole file is scanned.
+
+      Args:
+        filename: The filename of the mbox file.
+        previous: The 2-tuple returned by `load_index(index_filename)` or None.
+      Return:
+        A 3-tuple consisting of the file size, the list of all entries and the position of
+        the first new entry in that list. """
+  size = os.path.getsize(filename)
+  if size == 0:
+    return 0, [], 0
+  with open(filename, "rb") as fp:
+    mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      if previous is not None:
+        indexed_size, entries = previous
+        if indexed_size <= size and (len(entries) == 0 or (is_unchanged(mm, size, entries[0]) and is_unchanged(mm, size, entries[-1]))):
+          if indexed_size == size:
+            return size, entries, len(entries)
+          # the appended part may start with the empty line before its first separator
+          start = indexed_size
+          while mm[start:start + 1] == b"\n" or mm[start:start + 2] == b"\r\n":
+            start = mm.find(b"\n", start) + 1
+          if start >= size:
+            return size, entries, len(entries)
+          if is_separator(mm, start):
+            return size, entries + scan(mm, start, size), len(entries)
+      return size, scan(mm, 0, size), 0
+    finally:
+      mm.close()
+
+
+def read_headers(filename, entries):
+  """ Reads the header blocks of the given messages by seeking to their offsets.
+
+      Args:
+        filename: The filename of the mbox file.
+        entries: The list of index entries to read.
+      Return:
+        A generator of 2-tuples consisting of separator line and header block, both as bytes. """
+  with open(filename, "rb") as fp:
+    for offset, header_length, _ in entries:
+      fp.seek(offset)
+      data = fp.read(header_length)
+      line_end = data.find(b"\n")
+      if line_end == -1:
+        yield data, b""
+      else:
+        yield data[:line_end + 1], data[line_end + 1:]
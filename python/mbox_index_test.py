@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# author: Joschka Hüllmann <huellmann@uni-muenster.de>
+
+import unittest
+
+import os
+import os.path
+import shutil
+import unicodecsv as csv
+
+import mbox_extract
+import mbox_index
+from mbox_extract_test import TESTMBOX
+
+APPENDED = b'''\r
+From - Sat Jan 10 08:00:00 2015\r
+Subject: appended\r
+From: new@web.de\r
+To: user@web.de\r
+Date: Sat, 10 Jan 2015 08:00:00 +0000\r
+\r
+Body\r
+'''
+
+class TestMboxIndexMethods(unittest.TestCase):
+
+  def setUp(self):
+    os.makedirs("mbox_index_test.temp")
+    self.mbox = os.path.join("mbox_index_test.temp", "Inbox")
+    with open(self.mbox, "wb") as fp:
+      fp.write(TESTMBOX)
+
+  def tearDown(self):
+    shutil.rmtree("mbox_index_test.temp")
+
+  def test_build_index(self):
+    size, entries, first_new = mbox_index.build_index(self.mbox)
+    self.assertEqual((size, first_new), (len(TESTMBOX), 0))
+    # the index yields the same header blocks as the streaming reader
+    self.assertEqual(list(mbox_index.read_headers(self.mbox, entries)), list(mbox_extract.read_mbox_headers(self.mbox)))
+
+  def test_save_load_index(self):
+    size, entries, _ = mbox_index.build_index(self.mbox)
+    index_filename = os.path.join("mbox_index_test.temp", "Inbox.csv.idx")
+    mbox_index.save_index(index_filename, size, entries)
+    self.assertEqual(mbox_index.load_index(index_filename), (size, entries))
+    self.assertIsNone(mbox_index.load_index(os.path.join("mbox_index_test.temp", "Missing")))
+
+  def test_incremental(self):
+    previous = mbox_index.build_index(self.mbox)[:2]
+    self.assertEqual(mbox_index.build_index(self.mbox, previous), (previous[0], previous[1], len(previous[1])))
+
+    # flags changed in place do not invalidate the index
+    with open(self.mbox, "r+b") as fp:
+      fp.seek(TESTMBOX.index(b"0001"))
+      fp.write(b"0009")
+    self.assertEqual(mbox_index.build_index(self.mbox, previous)[2], len(previous[1]))
+
+    with open(self.mbox, "ab") as fp:
+      fp.write(APPENDED)
+    size, entries, first_new = mbox_index.build_index(self.mbox, previous)
+    self.assertEqual(first_new, len(previous[1]))
+    self.assertEqual(entries[:first_new], previous[1])
+    self.assertEqual(list(mbox_index.read_headers(self.mbox, entries)), list(mbox_extract.read_mbox_headers(self.mbox)))
+
+  def test_compaction(self):
+    previous = mbox_index.build_index(self.mbox)[:2]
+    # rewritten without the deleted message
+    start = TESTMBOX.index(b"From - Thu")
+    end = TESTMBOX.index(b"From - Fri")
+    with open(self.mbox, "wb") as fp:
+      fp.write(TESTMBOX[:start] + TESTMBOX[end:] + APPENDED)
+    size, entries, first_new = mbox_index.build_index(self.mbox, previous)
+    self.assertEqual(first_new, 0)
+    self.assertEqual(len(entries), 4)
+
+  def test_process_mbox_incremental(self):
+    outfile = os.path.join("mbox_index_test.temp", "Inbox.csv")
+    self.assertEqual(mbox_extract.process_mbox(self.mbox, outfile, True), 3)
+    self.assertTrue(os.path.isfile(os.path.join("mbox_index_test.temp", "Inbox.csv.idx")))
+    self.assertFalse(os.path.isfile(self.mbox + ".idx"))
+    self.assertEqual(mbox_extract.process_mbox(self.mbox, outfile, True), 0)
+    with open(self.mbox, "ab") as fp:
+      fp.write(APPENDED)
+    self.assertEqual(mbox_extract.process_mbox(self.mbox, outfile, True), 1)
+    with open(outfile, "rb") as fp:
+      rows = list(csv.reader(fp, delimiter=',', quotechar='"'))
+    self.assertEqual(len(rows), 4)
+    self.assertEqual(rows[3], ["appended", "new@web.de", "user@web.de", "2015-01-10 08:00:00"])
+
+if __name__ == '__main__':
+  unittest.main()
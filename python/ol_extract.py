@@ -23,18 +23,20 @@ TARGETS_SENT = (
 )
 
 
-def process_message(rows, message, path):
+def process_message(rows, message, path, targets_inbox=TARGETS_INBOX, targets_sent=TARGETS_SENT):
   """ Processes a message and appends to the list of rows as specified by path.
     Args:
       rows: The dict of output files, with each key being an output file and
             each value being a list of rows to append to and write to the
             output file.
       message: The given message to parse.
-      path: Is the key, to which list to append. """
+      path: Is the key, to which list to append.
+      targets_inbox: The folder paths whose messages are written to mails.inbox.csv.
+      targets_sent: The folder paths whose messages are written to mails.sent.csv. """
 
-  if path in TARGETS_INBOX:
+  if path in targets_inbox:
     outfile = "mails.inbox.csv"
-  elif path in TARGETS_SENT:
+  elif path in targets_sent:
     outfile = "mails.sent.csv"
   else:
     outfile = "mails.what.csv"
@@ -48,21 +50,23 @@ def process_message(rows, message, path):
   rows[outfile].append(row)
  
 
-def traverse_folder(rows, folder, path="", depth=0):
+def traverse_folder(rows, folder, path="", depth=0, targets_inbox=TARGETS_INBOX, targets_sent=TARGETS_SENT):
   """ Recursively traverses a folder and and appends all found items to the rows dict.
     Args:
       rows: The dict of row lists to append to. 
       folder: The current folder name being traversed. 
       path: The current full path to the folder. 
-      depth: The current recursion depth. """
+      depth: The current recursion depth.
+      targets_inbox: The folder paths whose messages are written to mails.inbox.csv.
+      targets_sent: The folder paths whose messages are written to mails.sent.csv. """
   print("[>] ENTERING %s" % path)
   count = 0
   for item in folder.sub_items:
     if isinstance(item, pypff.message):
-      process_message(rows, item, path.strip())
+      process_message(rows, item, path.strip(), targets_inbox, targets_sent)
       count = count + 1
     elif isinstance(item, pypff.folder):
-      traverse_folder(rows, item, path+"/"+item.name, depth+1)
+      traverse_folder(rows, item, path+"/"+item.name, depth+1, targets_inbox, targets_sent)
     else:
       pass
       # print "did not do anything for: %s (type: %s)" % (item.identifier, item.__class__.__name__)
@@ -81,9 +85,16 @@ def show_folders(folder, depth=0):
     show_folders(item, depth+1)
 
 
-if __name__ == "__main__":
-  """ magic main. """
-  pff_file = pypff.open("backup.pst")
+def main(pst_file, output_folder=".", targets_inbox=TARGETS_INBOX, targets_sent=TARGETS_SENT):
+  """ The main function that runs this program. Shows the folders of the pst file and writes
+      the messages of the target folders to mails.inbox.csv and mails.sent.csv, all other
+      messages to mails.what.csv.
+    Args:
+      pst_file: The filename of the pst file.
+      output_folder: The folder to write the csv files to.
+      targets_inbox: The folder paths whose messages are written to mails.inbox.csv.
+      targets_sent: The folder paths whose messages are written to mails.sent.csv. """
+  pff_file = pypff.open(pst_file)
 
   show_folders(pff_file.root_folder)
 
@@ -93,10 +104,10 @@ if __name__ == "__main__":
             "mails.sent.csv": [],
             "mails.what.csv": []}
 
-    traverse_folder(rows, root, "")
+    traverse_folder(rows, root, "", 0, targets_inbox, targets_sent)
 
     for file,entries in rows.items():
-      with open(os.path.join("", file), 'wb') as wp:
+      with open(os.path.join(output_folder, file), 'wb') as wp:
         writer = csv.writer(wp, delimiter=',', quotechar='"')
         for entry in entries:
           writer.writerow(entry)
@@ -104,3 +115,8 @@ if __name__ == "__main__":
     
   finally:
     pff_file.close()
+
+
+if __name__ == "__main__":
+  """ magic main. """
+  main("backup.pst")
@@ -7,23 +7,30 @@
                      sent emails and one for the received emails. The resulting
                      csv files contain an id, sender, recipients and timestamp. """
 
-import pypff
-import pytz
 import unicodecsv as csv
 
-from datetime import datetime
+from collections import deque, namedtuple
+from datetime import datetime, timezone
+import io
 import email
 import email.header
 import email.utils
 import email.parser
 import os
 import os.path
+import posixpath
+import queue
 import subprocess
 import sys
+import tarfile
+import threading
+import zipfile
 
 
 TARGET_ROOT_FOLDER = "backup.pst.export"
 
+ACTIVE_DIRECTORY_FILE = "active-directory.csv"
+
 TARGETS_INBOX = (
   # os.path.join("Oberste Ebene der Outlook-Datendatei", "Inbox"),
 )
@@ -32,6 +39,40 @@ TARGETS_SENT = (
   # os.path.join("Oberste Ebene der Outlook-Datendatei", "Sent Items"),
 )
 
+# Headers of the OutlookHeaders and Meeting files that make up an item.
+HEADER_FIELDS = {
+  "Subject:": "subject",
+  "Sender email address:": "source",
+  "Delivery time:": "time",
+}
+
+# Files of an item folder that are parsed, all other files are ignored.
+ITEM_FILES = ("InternetHeaders.txt", "OutlookHeaders.txt", "Meeting.txt", "Recipients.txt")
+
+# Number of legacyExchangeDns that are resolved with one powershell call.
+RESOLVE_BATCH_SIZE = 500
+
+# Maximum number of parsed items that wait for their legacyExchangeDns to be resolved.
+RESOLVE_WINDOW = 10000
+
+# A recipient of an item, address type is either SMTP or EX for legacyExchangeDns.
+Recipient = namedtuple("Recipient", ("address", "address_type"))
+
+
+class Item(object):
+  """ A row entry of an outlook item, which includes subject, source, time and list of
+      recipients. Slots keep the memory per item small on large exports. """
+  __slots__ = ("subject", "source", "time", "recipients")
+
+  def __init__(self, subject="", source="", time="", recipients=None):
+    self.subject = subject
+    self.source = source
+    self.time = time
+    self.recipients = recipients if recipients is not None else []
+
+  def __repr__(self):
+    return "Item(%r, %r, %r, %r)" % (self.subject, self.source, self.time, self.recipients)
+
 
 def process_transport_headers(filename):
   """ Extracts subject, from, to and formatted date from a textfile that contains transport headers.
@@ -39,10 +80,19 @@ def process_transport_headers(filename):
       Args:
         filename: The filename of the transport headers file.
       Return:
-        A 4-tuple consisting of subject, from, date, list(recipients). """
-  subject, source, time = "", "", ""
+        An item consisting of subject, from, date, list(recipients). """
   with open(filename, "r") as fp:
-    headers = email.parser.Parser().parsestr(fp.read(), True)
+    return parse_transport_headers(fp)
+
+
+def parse_transport_headers(fp):
+  """ Same as `process_transport_headers(filename)`, but reads from an open text file.
+
+      Args:
+        fp: The transport headers file.
+      Return:
+        An item consisting of subject, from, date, list(recipients). """
+  headers = email.parser.Parser().parsestr(fp.read(), True)
   if headers["To"] == None: headers["To"] = ""
   if headers["CC"] == None: headers["CC"] = ""
   # We only need comma if both are not empty
@@ -50,52 +100,79 @@ def process_transport_headers(filename):
     recipients = headers["To"] + "," + headers["CC"]
   else: 
     recipients = headers["To"] + headers["CC"]
-  return headers["Subject"], headers["From"], datetime.strptime(headers["Date"], "%a, %d %b %Y %H:%M:%S %z").strftime("%b %d, %Y %H:%M:%S.%f000 UTC%z"), [(recipients.replace("\r\n","").replace("\n",""), "SMTP"),]
+  return Item(headers["Subject"], headers["From"], datetime.strptime(headers["Date"], "%a, %d %b %Y %H:%M:%S %z").strftime("%b %d, %Y %H:%M:%S.%f000 UTC%z"), [Recipient(recipients.replace("\r\n","").replace("\n",""), "SMTP"),])
  
 
 def process_headers(filename):
   """ Extracts subject, from, and formatted date from a textfile that contains outlook headers.
+      The file is read line by line and reading stops as soon as all HEADER_FIELDS are found,
+      the first occurrence of each field is used.
 
     Args:
       filename: The filename of the outlook headers file.
     Return:
       A 3-tuple consisting of subject, from, date. """
-  subject, source, time = "", "", ""
   with open(filename, "r") as fp:
-    lines = fp.readlines()
-    for line in lines:
-      if line.startswith("Subject:"):
-        subject = line[len("Subject:"):].strip()
-      elif line.startswith("Sender email address:"):
-        source = line[len("Sender email address:"):].strip()
-      elif line.startswith("Delivery time:"):
-        time = line[len("Delivery time:"):].strip()
-  return subject, source, time
+    return parse_headers(fp)
+
+
+def parse_headers(fp):
+  """ Same as `process_headers(filename)`, but reads from an open text file.
+
+    Args:
+      fp: The outlook headers file.
+    Return:
+      A 3-tuple consisting of subject, from, date. """
+  fields = {"subject": "", "source": "", "time": ""}
+  missing = len(HEADER_FIELDS)
+  for line in fp:
+    for prefix, field in HEADER_FIELDS.items():
+      if line.startswith(prefix) and fields[field] == "":
+        fields[field] = line[len(prefix):].strip()
+        if fields[field] != "":
+          missing = missing - 1
+        break
+    if missing == 0:
+      break
+  return fields["subject"], fields["source"], fields["time"]
 
 
 def process_recipients(filename):
-  """ Extracts list of recipients from a textfile that contains outlook recipients.
+  """ Extracts list of recipients from a textfile that contains outlook recipients. The file
+      is read line by line, each recipient is a block of lines that ends with an empty line
+      or the end of the file. Blocks without email address are skipped.
 
     Args:
       filename: The filename of the outlook recipients file.
     Return:
-      A list of 2-tuples each consisting of (address, addresstype). """
-  recipients = []
+      A list of recipients each consisting of (address, addresstype). """
   with open(filename, "r") as fp:
-    lines = fp.readlines()
-    # always read until empty line
-    email = ""
-    email_type = ""
-    for line in lines:
-      if line.strip() == "":
-        recipients.append((
-          email,
-          email_type
-        ))
-      elif line.startswith("Email address:"):
-        email = line[len("Email address:"):].strip()
-      elif line.startswith("Address type:"):
-        email_type = line[len("Address type:"):].strip()
+    return parse_recipients(fp)
+
+
+def parse_recipients(fp):
+  """ Same as `process_recipients(filename)`, but reads from an open text file.
+
+    Args:
+      fp: The outlook recipients file.
+    Return:
+      A list of recipients each consisting of (address, addresstype). """
+  recipients = []
+  email = ""
+  email_type = ""
+  for line in fp:
+    if line.strip() == "":
+      if email != "":
+        recipients.append(Recipient(email, email_type))
+      email = ""
+      email_type = ""
+    elif line.startswith("Email address:"):
+      email = line[len("Email address:"):].strip()
+    elif line.startswith("Address type:"):
+      email_type = line[len("Address type:"):].strip()
+  # the last block is not always followed by an empty line
+  if email != "":
+    recipients.append(Recipient(email, email_type))
 
   return recipients
 
@@ -112,19 +189,40 @@ def create_row(filename):
     Args:
       filename: The folder name of the item.
     Return:
-      A 4-tuple consisting of subject, from, date, list(recipients). """
+      An item consisting of subject, from, date, list(recipients), or None if the
+      folder is not an item folder. """
   if not os.path.isdir(filename):
-    return
+    return None
+  files = dict((name, os.path.join(filename, name)) for name in ITEM_FILES if os.path.isfile(os.path.join(filename, name)))
+  return create_item(files, lambda path: open(path, "r"))
+
+
+def create_item(files, open_file):
+  """ Creates a row entry out of the files of an item folder, see `create_row(filename)`.
+
+    Args:
+      files: A dict from the names of the present ITEM_FILES to anything open_file accepts.
+      open_file: Opens the value of files as text file.
+    Return:
+      An item consisting of subject, from, date, list(recipients), or None if none of
+      the files were present. """
   (subject, source, time, recipients) = ("", "", "", [])
-  if os.path.isfile(os.path.join(filename,"InternetHeaders.txt")):
-    return list(process_transport_headers(os.path.join(filename,"InternetHeaders.txt")))
-  elif os.path.isfile(os.path.join(filename,"OutlookHeaders.txt")):
-    (subject, source, time) = process_headers(os.path.join(filename,"OutlookHeaders.txt"))
-  elif os.path.isfile(os.path.join(filename,"Meeting.txt")):
-    (subject, source, time) = process_headers(os.path.join(filename,"Meeting.txt"))
-  if os.path.isfile(os.path.join(filename,"Recipients.txt")):
-    recipients = process_recipients(os.path.join(filename,"Recipients.txt"))
-  return [subject, source, time, recipients]
+  if "InternetHeaders.txt" in files:
+    with open_file(files["InternetHeaders.txt"]) as fp:
+      return parse_transport_headers(fp)
+  elif "OutlookHeaders.txt" in files:
+    with open_file(files["OutlookHeaders.txt"]) as fp:
+      (subject, source, time) = parse_headers(fp)
+  elif "Meeting.txt" in files:
+    with open_file(files["Meeting.txt"]) as fp:
+      (subject, source, time) = parse_headers(fp)
+  if "Recipients.txt" in files:
+    with open_file(files["Recipients.txt"]) as fp:
+      recipients = parse_recipients(fp)
+  if (subject, source, time, recipients) == ("", "", "", []):
+    # none of the required files were found, so probably not an item folder.
+    return None
+  return Item(subject, source, time, recipients)
 
 
 def resolve_legacyexchangedn_lookup_old(entry, resolve_cache):
@@ -133,7 +231,7 @@ def resolve_legacyexchangedn_lookup_old(entry, resolve_cache):
   if entry[1] == "EX":
     legacyExchangeDN = entry[0].lower()
     if legacyExchangeDN in resolve_cache:
-      return (resolve_cache[legacyExchangeDN], "SMTP")
+      return Recipient(resolve_cache[legacyExchangeDN], "SMTP")
     
     ps_command = ["powershell.exe", "-command"]
     ps_filter_template = "Get-ADObject -Filter {{legacyExchangeDN -eq '{0}'}} -Properties mail | foreach {{ $_.mail }}"
@@ -141,21 +239,22 @@ def resolve_legacyexchangedn_lookup_old(entry, resolve_cache):
     email, _ = p.communicate()
     email = email.strip().lower()
     resolve_cache[legacyExchangeDN] = email
-    return (email, "SMTP")
+    return Recipient(email, "SMTP")
   else:
     return entry
 
 
-def refresh_resolve_cache(unresolved_entries):
+def refresh_resolve_cache(unresolved_entries, lookup_file=ACTIVE_DIRECTORY_FILE):
   """ This methods takes a list of unresolved legacyExchangeDns and saves them to a temporary file.
       The temporary file is pushed to a powershell script that invokes the Cmdlet Get-ADObject to
       try and retrieve the email address from the default active directory. Powershell and the 
       Active Directory Remote Administration Tools (e.g. WindowsTH-RSAT_WS_1803-x64.msu) are required.
-      The addresses are resolved in the hardcoded file active-directory.csv. First column is the
+      The addresses are appended to the lookup file, by default active-directory.csv. First column is the
       legacyExchangeDn, second column is the email address if available.
 
     Args:
       unresolved_entries: The list of legacyExchangeDns
+      lookup_file: The active directory lookup file to append to.
     Return:
       None """
 
@@ -164,21 +263,206 @@ def refresh_resolve_cache(unresolved_entries):
     for entry in unresolved_entries:
       fp.write("%s\n" % entry)
 
-  ps_command_param = """Get-Content .\\active-directory.new.csv.temp | ForEach-Object { Get-ADObject -Filter {legacyExchangeDN -eq $_ } -Property legacyExchangeDN,mail | Select-Object legacyExchangeDN,mail} | Export-Csv active-directory.csv -Append -NoTypeInformation"""
+  ps_command_param = """Get-Content .\\active-directory.new.csv.temp | ForEach-Object { Get-ADObject -Filter {legacyExchangeDN -eq $_ } -Property legacyExchangeDN,mail | Select-Object legacyExchangeDN,mail} | Export-Csv '%s' -Append -NoTypeInformation""" % lookup_file.replace("'", "''")
   ps_command = ["powershell.exe", ps_command_param]
   p = subprocess.Popen(ps_command, stdout=subprocess.PIPE)
   p.communicate()
 
 
-def resolve_legacyexchangedn(rows):
+def load_resolve_cache(lookup_file=ACTIVE_DIRECTORY_FILE, offset=None):
+  """ Loads the prefetched ActiveDirectory lookup file. First column is the legacyExchangeDn, second
+      column is the email address if available.
+
+    Args:
+      lookup_file: The active directory lookup file.
+      offset: If given, only the entries appended after this byte offset are loaded.
+
+    Return:
+      The resolve cache, a dict from lowercase legacyExchangeDn to lowercase email address. """
+  resolve_cache = {}
+  with open(lookup_file, 'rb') as fp:
+    reader = csv.reader(fp, delimiter=',', quotechar='"')
+    if offset is None:
+      next(reader) # skip header
+    else:
+      fp.seek(offset)
+    for row in reader:
+      if row[0].strip() != "" and row[1].strip() != "":
+        resolve_cache[row[0].strip().lower()] = row[1].strip().lower()
+  return resolve_cache
+
+
+def get_unresolved_entries(row, resolve_cache):
+  """ Returns the legacyExchangeDns of an item that are not in the resolve cache.
+
+    Args:
+      row: The item.
+      resolve_cache: The resolve cache.
+
+    Return:
+      The list of lowercase legacyExchangeDns. """
+  unresolved_entries = []
+  # resolve sender, here we do not know if it is email or legacyexchangeDn, so we infer it via @
+  if row.source.lower() not in resolve_cache and "@" not in row.source:
+    unresolved_entries.append(row.source.lower())
+  # resolve recipients
+  for recipient in row.recipients:
+    if recipient.address_type == "EX" and recipient.address.lower() not in resolve_cache:
+      unresolved_entries.append(recipient.address.lower())
+  return unresolved_entries
+
+
+def apply_resolve_cache(row, resolve_cache):
+  """ Substitutes the legacyExchangeDns of an item that are in the resolve cache by their
+      email address. Missing entries are not substituted.
+
+    Args:
+      row: The item.
+      resolve_cache: The resolve cache.
+
+    Return:
+      None. The item is mutated. """
+  # resolve recipients
+  resolved_recipients = []
+  for recipient in row.recipients:
+    if recipient.address_type == "EX" and recipient.address.lower() in resolve_cache:
+      resolved_recipients.append(Recipient(resolve_cache[recipient.address.lower()], "SMTP"))
+    else:
+      resolved_recipients.append(recipient)
+  row.recipients = resolved_recipients
+  # and try-resolve sender
+  if row.source.lower() in resolve_cache:
+    row.source = resolve_cache[row.source.lower()]
+
+
+def resolve_batch(unresolved_entries, lookup_file=ACTIVE_DIRECTORY_FILE):
+  """ Fetches a batch of legacyExchangeDns via `refresh_resolve_cache(unresolved_entries)` and
+      returns the entries that were appended to the lookup file.
+
+    Args:
+      unresolved_entries: The list of legacyExchangeDns.
+      lookup_file: The active directory lookup file.
+
+    Return:
+      A dict from lowercase legacyExchangeDn to lowercase email address. """
+  offset = os.path.getsize(lookup_file)
+  refresh_resolve_cache(unresolved_entries, lookup_file)
+  os.remove("active-directory.new.csv.temp")
+  return load_resolve_cache(lookup_file, offset)
+
+
+def resolve_worker(requests, responses, lookup_file):
+  """ Resolves the batches of the request queue one after another and puts the results into the
+      response queue, until None is requested.
+
+    Args:
+      requests: The queue of 2-tuples consisting of batch number and list of legacyExchangeDns.
+      responses: The queue of 2-tuples consisting of batch number and resolved dict or exception.
+      lookup_file: The active directory lookup file.
+
+    Return:
+      None. """
+  while True:
+    request = requests.get()
+    if request is None:
+      return
+    batch_id, unresolved_entries = request
+    try:
+      responses.put((batch_id, resolve_batch(unresolved_entries, lookup_file)))
+    except Exception as e:
+      responses.put((batch_id, e))
+
+
+def resolve_legacyexchangedn_pipelined(rows, lookup_file=ACTIVE_DIRECTORY_FILE, batch_size=RESOLVE_BATCH_SIZE, window=RESOLVE_WINDOW):
+  """ Resolves the legacyExchangeDn to email address for a stream of items, while the items are
+      still being parsed. Unresolved legacyExchangeDns are collected in batches that are resolved
+      by a worker thread via `resolve_batch(unresolved_entries)`. Items are yielded in order as
+      soon as all their legacyExchangeDns have been looked up. If more than window items are
+      waiting, parsing is paused until the oldest item is resolved.
+
+    Args:
+      rows: The iterable of items to perform lookup on.
+      lookup_file: The active directory lookup file.
+      batch_size: The number of legacyExchangeDns per batch.
+      window: The maximum number of items waiting for their lookup.
+
+    Return:
+      A generator of the resolved items. """
+  resolve_cache = load_resolve_cache(lookup_file)
+  # batch number of every requested legacyExchangeDn, resolved or not
+  requested = {}
+  batch = []
+  submitted, completed = 0, 0
+  # 2-tuples consisting of item and the batch number it waits for
+  waiting = deque()
+  requests, responses = queue.Queue(), queue.Queue()
+  worker = threading.Thread(target=resolve_worker, args=(requests, responses, lookup_file))
+  worker.daemon = True
+  worker.start()
+
+  def submit():
+    requests.put((submitted, batch[:]))
+    del batch[:]
+    return submitted + 1
+
+  def receive(block):
+    received = 0
+    while True:
+      try:
+        _, result = responses.get(block and received == 0)
+      except queue.Empty:
+        return received
+      if isinstance(result, Exception):
+        raise result
+      resolve_cache.update(result)
+      received = received + 1
+
+  try:
+    for row in rows:
+      last_batch = -1
+      for entry in get_unresolved_entries(row, resolve_cache):
+        if entry not in requested:
+          requested[entry] = submitted
+          batch.append(entry)
+        last_batch = max(last_batch, requested[entry])
+      waiting.append((row, last_batch))
+      if len(batch) >= batch_size:
+        submitted = submit()
+      completed = completed + receive(False)
+      while len(waiting) > window or (len(waiting) > 0 and waiting[0][1] < completed):
+        if waiting[0][1] >= completed:
+          if waiting[0][1] == submitted:
+            submitted = submit()
+          completed = completed + receive(True)
+          continue
+        row, _ = waiting.popleft()
+        apply_resolve_cache(row, resolve_cache)
+        yield row
+
+    if len(batch) > 0:
+      submitted = submit()
+    while len(waiting) > 0:
+      if waiting[0][1] >= completed:
+        completed = completed + receive(True)
+        continue
+      row, _ = waiting.popleft()
+      apply_resolve_cache(row, resolve_cache)
+      yield row
+  finally:
+    requests.put(None)
+    worker.join()
+
+
+def resolve_legacyexchangedn(rows, lookup_file=ACTIVE_DIRECTORY_FILE):
   """ Resolves the legacyExchangeDn to email address for all rows. It uses a prefetched ActiveDirectory
-      lookup file hardcoded as active-directory.csv. First column is the legacyExchangeDn, second column
+      lookup file, by default active-directory.csv. First column is the legacyExchangeDn, second column
       is the email address if available. The resolve cache is loaded from that prefetched file. Missing
       entries are then aggregated and fetched via powershell and the Get-ADObject Cmdlet; the resolve
       cache is refreshed. Then the lookup is performed. Missing entries are not substituted.
 
     Args:
-      rows: the list of rows to perform lookup on.
+      rows: the list of items to perform lookup on.
+      lookup_file: The active directory lookup file.
 
     Return:
       None. The parameter is mutated. """
@@ -187,50 +471,26 @@ def resolve_legacyexchangedn(rows):
   # Get-ADUser -f {name -like "*"} -Property legacyExchangeDn,mail | Select-Object legacyExchangeDn,mail | Export-Csv OUTPUT.csv
 
   # (1) Load pre-fetched active directory lookup table
-  resolve_cache = {}
-  with open("active-directory.csv", 'rb') as fp:
-    reader = csv.reader(fp, delimiter=',', quotechar='"')
-    next(reader) # skip header
-    for row in reader:
-      if row[0].strip() != "" and row[1].strip() != "":
-        resolve_cache[row[0].strip().lower()] = row[1].strip().lower()
+  resolve_cache = load_resolve_cache(lookup_file)
 
   # (2) Write unresolved names into file for powershell script
   unresolved_entries = []
+  seen = set()
   for row in rows:
-    # resolve sender, here we do not know if it is email or legacyexchangeDn, so we infer it via @
-    if row[1].lower() not in resolve_cache and row[1].lower() not in unresolved_entries and "@" not in row[1]:
-      unresolved_entries.append(row[1].lower())
-    # resolve recipients
-    for recipient in row[3]:
-      if recipient[1] == "EX" and recipient[0].lower() not in resolve_cache and recipient[0].lower() not in unresolved_entries:
-        unresolved_entries.append(recipient[0].lower())
+    for entry in get_unresolved_entries(row, resolve_cache):
+      if entry not in seen:
+        seen.add(entry)
+        unresolved_entries.append(entry)
 
-  refresh_resolve_cache(unresolved_entries)
+  refresh_resolve_cache(unresolved_entries, lookup_file)
   os.remove("active-directory.new.csv.temp")
 
   # (3) reload cache
-  resolve_cache = {}
-  with open("active-directory.csv", 'rb') as fp:
-    reader = csv.reader(fp, delimiter=',', quotechar='"')
-    next(reader) # skip header
-    for row in reader:
-      if row[0].strip() != "" and row[1].strip() != "":
-        resolve_cache[row[0].strip().lower()] = row[1].strip().lower()
+  resolve_cache = load_resolve_cache(lookup_file)
 
   # (4) do the look up
   for row in rows:
-    # resolve recipients
-    resolved_recipients = []
-    for recipient in row[3]:
-      if recipient[1] == "EX" and recipient[0].lower() in resolve_cache:
-        resolved_recipients.append((resolve_cache[recipient[0].lower()], "SMTP"))
-      else:
-        resolved_recipients.append(recipient)
-    row[3] = resolved_recipients
-    # and try-resolve sender
-    if row[1].lower() in resolve_cache:
-      row[1] = resolve_cache[row[1].lower()]
+    apply_resolve_cache(row, resolve_cache)
 
 
 def resolve_legacyexchangedn_old(rows):
@@ -240,11 +500,11 @@ def resolve_legacyexchangedn_old(rows):
   for row in rows:
     # resolve recipients
     resolved_recipients = []
-    for recipient in row[3]:
+    for recipient in row.recipients:
       resolved_recipients.append(resolve_legacyexchangedn_lookup(recipient, resolve_cache))
-    row[3] = resolved_recipients
+    row.recipients = resolved_recipients
     # and resolve sender
-    row[1] = resolve_legacyexchangedn_lookup((row[1], "EX"), resolve_cache)[0]
+    row.source = resolve_legacyexchangedn_lookup(Recipient(row.source, "EX"), resolve_cache).address
 
 
 def get_recipients_str(recipients):
@@ -299,18 +559,18 @@ def get_format_date(datestr):
 
   # TODO: Test this better... Datetime hell.
   #       So, by using %Z we always get a time aware datetime object and can use
-  #       astime with pytz.utc to convert it to UTC and then format the string.
+  #       astime with timezone.utc to convert it to UTC and then format the string.
   dt = datetime.strptime(datestr, source_format)
   if dt.tzinfo == None:
     raise ValueError("This should not happen, error with missing timezone aware datetime object.")
-  dt = dt.astimezone(pytz.utc)
+  dt = dt.astimezone(timezone.utc)
   return dt.strftime(target_format)
 
 
 def write_csv(rows, filename):
   """ Writes the rows to the given file.
     Args:
-      rows: the list of rows.
+      rows: the list of items.
       filename: the output filename.
     Return:
       None.
@@ -320,36 +580,191 @@ def write_csv(rows, filename):
     for row in rows:
       # from (subject, source, time, recipients) to (subject, source, recipients, date)
       try:
-        writer.writerow([row[0], row[1], get_recipients_str(row[3]), get_format_date(row[2])])
+        writer.writerow([row.subject, row.source, get_recipients_str(row.recipients), get_format_date(row.time)])
       except ValueError:
         print(row)
         raise
 
 
-def process_folder_set(root_folder, folder_set, name):
-  """ Processes a set of folders that are exported from pffexport tools.
+def resolve_csv(filename, outfile, lookup_file=ACTIVE_DIRECTORY_FILE):
+  """ Resolves the legacyExchangeDns in a csv file that was written without resolving them, see
+      `process_folder_set(root_folder, folder_set, name, resolve)`. Recipients starting with /o=
+      are taken as legacyExchangeDns, the lookup itself is done by `resolve_legacyexchangedn(rows)`.
     Args:
-      root_folder: The root folder to start looking into.
-      folder_set: The list of folder paths relative to root folder to include in the search and process.
-      name: The name of the output file.
+      filename: The csv file to resolve.
+      outfile: The output filename.
+      lookup_file: The active directory lookup file.
     Return:
       None. """
   rows = []
+  with open(filename, "rb") as fp:
+    reader = csv.reader(fp, delimiter=',', quotechar='"')
+    for row in reader:
+      recipients = [Recipient(recipient, "EX" if recipient.lower().startswith("/o=") else "SMTP") for recipient in row[2].split(",")]
+      rows.append(Item(row[0], row[1], row[3], recipients))
+
+  resolve_legacyexchangedn(rows, lookup_file)
+
+  with open(outfile, "wb") as fp:
+    writer = csv.writer(fp, delimiter=',', quotechar='"')
+    for row in rows:
+      writer.writerow([row.subject, row.source, get_recipients_str(row.recipients), row.time])
+
+
+def iter_folder_set(root_folder, folder_set):
+  """ Parses the items of a set of folders that are exported from pffexport tools.
+    Args:
+      root_folder: The root folder to start looking into.
+      folder_set: The list of folder paths relative to root folder to include in the search and process.
+    Return:
+      A generator of items. """
   for folder in folder_set:
     for filename in os.listdir(os.path.join(root_folder,folder)):
       row = create_row(os.path.join(root_folder,folder,filename))
-      if row == ["", "", "", []]:
-        # None if the required files were found, so probably not an item folder.
+      if row is None:
         continue
-      rows.append(row)
+      yield row
+
+
+def iter_archive_members(archive):
+  """ Iterates over the ITEM_FILES in a tar or zip archive in archive order, other members are
+      skipped without reading them. Tar archives are read as a stream, they may be compressed.
+
+    Args:
+      archive: The filename of the archive.
+    Return:
+      A generator of 2-tuples consisting of the member path and a function that reads the
+      member's content as bytes. The function must be called before the next member. """
+  if zipfile.is_zipfile(archive):
+    with zipfile.ZipFile(archive) as zf:
+      for info in zf.infolist():
+        if not info.is_dir() and posixpath.basename(info.filename) in ITEM_FILES:
+          yield info.filename, lambda info=info: zf.read(info)
+  else:
+    with tarfile.open(archive, "r|*") as tf:
+      for member in tf:
+        if member.isfile() and posixpath.basename(member.name) in ITEM_FILES:
+          yield member.name, lambda member=member: tf.extractfile(member).read()
+
+
+def get_archive_root(archive):
+  """ Determines the folder that all members of a tar or zip archive are stored in. Only the
+      member names are read, tar archives are read as a stream and only until a second top
+      level entry is found.
+
+    Args:
+      archive: The filename of the archive.
+    Return:
+      The name of the folder, or None if there are several top level entries. """
+  if zipfile.is_zipfile(archive):
+    with zipfile.ZipFile(archive) as zf:
+      names = zf.namelist()
+    return get_common_root(names)
+  with tarfile.open(archive, "r|*") as tf:
+    return get_common_root(member.name for member in tf)
+
+
+def get_common_root(names):
+  """ Determines the first path component that all of the given member names share.
 
-  resolve_legacyexchangedn(rows)
+    Args:
+      names: An iterable of member names.
+    Return:
+      The shared first path component, or None if there is none. """
+  root = None
+  for name in names:
+    parts = [part for part in name.split("/") if part not in ("", ".")]
+    if len(parts) == 0:
+      continue
+    if root is None:
+      root = parts[0]
+    elif parts[0] != root:
+      return None
+  return root
+
+
+def iter_archive_folder_set(archive, folder_set):
+  """ Parses the items of a set of folders from a tar or zip archive of the pffexport tree,
+      without unpacking it. The archive may contain the root folder itself or only its content,
+      see `get_archive_root(archive)`. If all members are stored in one folder and the folder
+      paths do not start with it, it is taken as the root folder. The members are read in
+      archive order and grouped by item folder, so all files of an item must be stored
+      together, as done by tar and zip when packing a directory tree. Like
+      `iter_folder_set(root_folder, folder_set)`, only the items directly in the given folders
+      are parsed, not those of folders with the same name further down the tree.
+    Args:
+      archive: The filename of the archive.
+      folder_set: The list of folder paths relative to root folder to include in the search and process.
+    Return:
+      A generator of items. """
+  folders = set(tuple(part for part in folder.replace("\\", "/").split("/") if part != "") for folder in folder_set)
+  root = get_archive_root(archive)
+  if root is not None and all(len(folder) > 0 and folder[0] == root for folder in folders):
+    # the archive only contains the content of the root folder, which is a single folder
+    root = None
+  current, files, finished = None, {}, set()
+  for path, read in iter_archive_members(archive):
+    parts = tuple(part for part in path.split("/") if part not in ("", "."))
+    if root is not None:
+      parts = parts[1:]
+    item_folder, parent = parts[:-1], parts[:-2]
+    if len(item_folder) == 0 or parent not in folders:
+      continue
+    if item_folder != current:
+      if item_folder in finished:
+        raise ValueError("The files of item %s are not stored together in %s." % ("/".join(item_folder), archive))
+      if current is not None:
+        finished.add(current)
+        row = create_item(files, lambda data: io.TextIOWrapper(io.BytesIO(data)))
+        if row is not None:
+          yield row
+      current, files = item_folder, {}
+    files[parts[-1]] = read()
+  if current is not None:
+    row = create_item(files, lambda data: io.TextIOWrapper(io.BytesIO(data)))
+    if row is not None:
+      yield row
+
+
+def process_folder_set(root_folder, folder_set, name, resolve=True, lookup_file=ACTIVE_DIRECTORY_FILE):
+  """ Processes a set of folders that are exported from pffexport tools. The legacyExchangeDns
+      are resolved while the items are parsed and each item is written as soon as it is resolved,
+      see `resolve_legacyexchangedn_pipelined(rows)`.
+    Args:
+      root_folder: The root folder to start looking into, or a tar or zip archive of it.
+      folder_set: The list of folder paths relative to root folder to include in the search and process.
+      name: The name of the output file.
+      resolve: If false, the legacyExchangeDns are written unresolved, see `resolve_csv(filename, outfile)`.
+      lookup_file: The active directory lookup file.
+    Return:
+      None. """
+  if os.path.isfile(root_folder):
+    rows = iter_archive_folder_set(root_folder, folder_set)
+  else:
+    rows = iter_folder_set(root_folder, folder_set)
+
+  if resolve:
+    rows = resolve_legacyexchangedn_pipelined(rows, lookup_file)
 
   write_csv(rows, name)
 
 
+def main(root_folder=TARGET_ROOT_FOLDER, targets_sent=TARGETS_SENT, targets_inbox=TARGETS_INBOX, output_folder=".", resolve=True, lookup_file=ACTIVE_DIRECTORY_FILE):
+  """ The main function that runs this program. Processes the sent and the inbox folders of the
+      pffexport tree and writes them to target.sent.csv and target.inbox.csv.
+    Args:
+      root_folder: The root folder of the pffexport tree, or a tar or zip archive of it.
+      targets_sent: The list of sent folder paths relative to root folder.
+      targets_inbox: The list of inbox folder paths relative to root folder.
+      output_folder: The folder to write the csv files to.
+      resolve: If false, the legacyExchangeDns are written unresolved.
+      lookup_file: The active directory lookup file.
+    Return:
+      None. """
+  process_folder_set(root_folder, targets_sent, os.path.join(output_folder, "target.sent.csv"), resolve, lookup_file)
+  process_folder_set(root_folder, targets_inbox, os.path.join(output_folder, "target.inbox.csv"), resolve, lookup_file)
+
+
 if __name__ == "__main__":
   """ magic main. """
-  root_folder = TARGET_ROOT_FOLDER
-  process_folder_set(root_folder, TARGETS_SENT, "target.sent.csv")
-  process_folder_set(root_folder, TARGETS_INBOX, "target.inbox.csv")
+  main()
@@ -9,6 +9,10 @@ import os.path
 from glob import glob
 import unicodecsv as csv
 from io import BytesIO
+import shutil
+import tarfile
+import zipfile
+from unittest import mock
 
 import ol_transform
 
@@ -61,6 +65,134 @@ class TestTransformMethods(unittest.TestCase):
     self.assertRaises(TypeError, ol_transform.get_recipients_str, recipients7)
     self.assertRaises(TypeError, ol_transform.get_recipients_str, recipients8)
 
+  def test_process_headers(self):
+    try:
+      with open("ol_transform_test.headers.temp", "w") as fp:
+        fp.write("Client submit time:\tFeb 06, 2019 09:41:40.000000000 UTC\nSubject:\tHello\nSender email address:\t/o=Org/cn=alice\n" \
+                 "Delivery time:\tFeb 06, 2019 09:41:44.223645200 UTC\nSubject:\tNot read\n")
+      self.assertEqual(ol_transform.process_headers("ol_transform_test.headers.temp"), ("Hello", "/o=Org/cn=alice", "Feb 06, 2019 09:41:44.223645200 UTC"))
+    finally:
+      os.remove("ol_transform_test.headers.temp")
+
+  def test_process_recipients(self):
+    recipients = "\nDisplay name:\tAlice\nAddress type:\tEX\nEmail address:\t/o=Org/cn=alice\n\n\nDisplay name:\tBob\nAddress type:\tSMTP\nEmail address:\tbob@web.de"
+    try:
+      for content in (recipients, recipients + "\n", recipients + "\n\n"):
+        with open("ol_transform_test.recipients.temp", "w") as fp:
+          fp.write(content)
+        result = ol_transform.process_recipients("ol_transform_test.recipients.temp")
+        self.assertEqual(result, [("/o=Org/cn=alice", "EX"), ("bob@web.de", "SMTP")])
+        self.assertEqual(result[1].address, "bob@web.de")
+        self.assertEqual(result[1].address_type, "SMTP")
+    finally:
+      os.remove("ol_transform_test.recipients.temp")
+
+  def test_create_row(self):
+    try:
+      os.makedirs(os.path.join("ol_transform_test.temp", "Message00001"))
+      os.makedirs(os.path.join("ol_transform_test.temp", "Attachments"))
+      with open(os.path.join("ol_transform_test.temp", "Message00001", "OutlookHeaders.txt"), "w") as fp:
+        fp.write("Subject:\tHello\nSender email address:\talice@web.de\nDelivery time:\tFeb 06, 2019 09:41:44.223645200 UTC\n")
+      with open(os.path.join("ol_transform_test.temp", "Message00001", "Recipients.txt"), "w") as fp:
+        fp.write("Address type:\tSMTP\nEmail address:\tbob@web.de\n")
+      row = ol_transform.create_row(os.path.join("ol_transform_test.temp", "Message00001"))
+      self.assertEqual((row.subject, row.source, row.time, row.recipients), ("Hello", "alice@web.de", "Feb 06, 2019 09:41:44.223645200 UTC", [("bob@web.de", "SMTP")]))
+      self.assertRaises(AttributeError, setattr, row, "other", 1)
+      self.assertIsNone(ol_transform.create_row(os.path.join("ol_transform_test.temp", "Attachments")))
+      self.assertIsNone(ol_transform.create_row(os.path.join("ol_transform_test.temp", "Missing")))
+    finally:
+      shutil.rmtree("ol_transform_test.temp")
+
+  def test_resolve_legacyexchangedn_pipelined(self):
+    directory = {"/o=org/cn=alice": "alice@web.de", "/o=org/cn=bob": "bob@web.de", "/o=org/cn=carol": "carol@web.de"}
+    batches = []
+    def resolve_batch(unresolved_entries, lookup_file):
+      batches.append(unresolved_entries)
+      return dict((entry, directory[entry]) for entry in unresolved_entries if entry in directory)
+
+    parsed = []
+    def rows():
+      for i in range(20):
+        parsed.append(i)
+        yield ol_transform.Item("s%d" % i, "/o=Org/cn=%s" % ("alice", "bob", "dave")[i % 3], "t",
+          [ol_transform.Recipient("/o=Org/cn=carol", "EX"), ol_transform.Recipient("eve@web.de", "SMTP")])
+
+    try:
+      with open("ol_transform_test.ad.temp", "w") as fp:
+        fp.write('"legacyExchangeDN","mail"\n"/o=org/cn=alice","alice@web.de"\n')
+      with mock.patch.object(ol_transform, "resolve_batch", resolve_batch):
+        result = []
+        for row in ol_transform.resolve_legacyexchangedn_pipelined(rows(), "ol_transform_test.ad.temp", batch_size=2, window=3):
+          # never more than window items wait for their lookup
+          self.assertLessEqual(len(parsed) - len(result), 4)
+          result.append(row)
+    finally:
+      os.remove("ol_transform_test.ad.temp")
+
+    self.assertEqual([row.subject for row in result], ["s%d" % i for i in range(20)])
+    self.assertEqual([row.source for row in result[:3]], ["alice@web.de", "bob@web.de", "/o=Org/cn=dave"])
+    self.assertEqual(result[5].recipients, [("carol@web.de", "SMTP"), ("eve@web.de", "SMTP")])
+    # alice is prefetched, every other legacyExchangeDn is requested once
+    self.assertEqual(sorted(entry for batch in batches for entry in batch), ["/o=org/cn=bob", "/o=org/cn=carol", "/o=org/cn=dave"])
+
+  def test_iter_archive_folder_set(self):
+    root = os.path.join("ol_transform_test.temp", "backup.pst.export")
+    files = {
+      os.path.join("Top", "Sent Items", "Message00001", "OutlookHeaders.txt"): "Subject:\tOne\nSender email address:\talice@web.de\nDelivery time:\tFeb 06, 2019 09:41:44.223645200 UTC\n",
+      os.path.join("Top", "Sent Items", "Message00001", "Attachments", "Recipients.txt"): "Address type:\tSMTP\nEmail address:\tnot@web.de\n",
+      os.path.join("Top", "Sent Items", "Message00001", "Recipients.txt"): "Address type:\tEX\nEmail address:\t/o=Org/cn=bob\n",
+      os.path.join("Top", "Sent Items", "Message00002", "Meeting.txt"): "Subject:\tTwo\nSender email address:\tbob@web.de\nDelivery time:\tFeb 07, 2019 09:41:44.223645200 UTC\n",
+      os.path.join("Top", "Sent Items", "Message00002", "Attachment.txt"): "ignored",
+      os.path.join("Top", "Inbox", "Message00003", "OutlookHeaders.txt"): "Subject:\tThree\n",
+      os.path.join("Top", "Archive", "2019", "Top", "Inbox", "Message00004", "OutlookHeaders.txt"): "Subject:\tFour\n",
+      os.path.join("Recovered", "Top", "Inbox", "Message00005", "OutlookHeaders.txt"): "Subject:\tFive\n",
+    }
+    try:
+      for path, content in files.items():
+        if not os.path.isdir(os.path.dirname(os.path.join(root, path))):
+          os.makedirs(os.path.dirname(os.path.join(root, path)))
+        with open(os.path.join(root, path), "w") as fp:
+          fp.write(content)
+      with tarfile.open(os.path.join("ol_transform_test.temp", "export.tar.gz"), "w:gz") as tf:
+        tf.add(root, "backup.pst.export")
+      with zipfile.ZipFile(os.path.join("ol_transform_test.temp", "export.zip"), "w") as zf:
+        for dirpath, _, filenames in os.walk(root):
+          for filename in filenames:
+            zf.write(os.path.join(dirpath, filename), os.path.relpath(os.path.join(dirpath, filename), root))
+
+      folder_set = (os.path.join("Top", "Sent Items"),)
+      expected = sorted(repr(row) for row in ol_transform.iter_folder_set(root, folder_set))
+      self.assertEqual(len(expected), 2)
+      self.assertIn(repr(ol_transform.Item("One", "alice@web.de", "Feb 06, 2019 09:41:44.223645200 UTC", [ol_transform.Recipient("/o=Org/cn=bob", "EX")])), expected)
+      for archive in ("export.tar.gz", "export.zip"):
+        rows = ol_transform.iter_archive_folder_set(os.path.join("ol_transform_test.temp", archive), folder_set)
+        self.assertEqual(sorted(repr(row) for row in rows), expected)
+
+      # folders with the same path further down the tree are not included
+      folder_set = (os.path.join("Top", "Inbox"),)
+      expected = [repr(row) for row in ol_transform.iter_folder_set(root, folder_set)]
+      self.assertEqual(expected, [repr(ol_transform.Item("Three", "", "", []))])
+      for archive in ("export.tar.gz", "export.zip"):
+        rows = ol_transform.iter_archive_folder_set(os.path.join("ol_transform_test.temp", archive), folder_set)
+        self.assertEqual([repr(row) for row in rows], expected)
+
+      # an archive with a single top level folder that is part of the folder paths
+      with zipfile.ZipFile(os.path.join("ol_transform_test.temp", "top.zip"), "w") as zf:
+        zf.writestr("Top/Inbox/Message00001/OutlookHeaders.txt", "Subject:\tOne\n")
+        zf.writestr("Top/Inbox/Message00002/OutlookHeaders.txt", "Subject:\tTwo\n")
+      rows = ol_transform.iter_archive_folder_set(os.path.join("ol_transform_test.temp", "top.zip"), folder_set)
+      self.assertEqual([row.subject for row in rows], ["One", "Two"])
+
+      # the files of an item must be stored together
+      with zipfile.ZipFile(os.path.join("ol_transform_test.temp", "split.zip"), "w") as zf:
+        zf.writestr("Top/Inbox/Message00001/OutlookHeaders.txt", "Subject:\tOne\n")
+        zf.writestr("Top/Inbox/Message00002/OutlookHeaders.txt", "Subject:\tTwo\n")
+        zf.writestr("Top/Inbox/Message00001/Recipients.txt", "Address type:\tSMTP\nEmail address:\tbob@web.de\n")
+      rows = ol_transform.iter_archive_folder_set(os.path.join("ol_transform_test.temp", "split.zip"), folder_set)
+      self.assertRaises(ValueError, list, rows)
+    finally:
+      shutil.rmtree("ol_transform_test.temp")
+
 def test_integration(self):
     self.fail("Not implemented yet.")
 
@@ -17,9 +17,12 @@ import email.header
 import email.utils
 import os.path
 import re
+from datetime import datetime
 from glob import glob
 import unicodecsv as csv
 
+import mapping_index
+
 # Schema
 SUBJECT = 0
 SOURCE = 1
@@ -29,6 +32,30 @@ TIME = 3
 # Does some address reach the maximum?
 MAX_ADDRESS = 9999
 
+# Plain address cell tokens without encoded words, quotes, comments or group syntax,
+# i.e. user@host or Name <user@host>. Group 1 or 2 is the address.
+PLAIN_ADDRESS = re.compile(r"[\w .\-]*<([A-Za-z0-9._+\-]+@[A-Za-z0-9.\-]+)>|([A-Za-z0-9._+\-]+@[A-Za-z0-9.\-]+)")
+
+# Known formats of the TIME column. The first one is what the addon and ol_transform.py
+# write, the second one is found in older exports. The last one allows dates only, e.g.
+# as bounds of the time filter.
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%d.%m.%Y %H:%M", "%Y-%m-%d")
+
+# Period buckets in the aggregated output, given as the length of the prefix of a time in
+# the first of TIME_FORMATS, e.g. 2015-01 for month.
+PERIOD_LENGTHS = {
+  "year": 4,
+  "month": 7,
+  "day": 10,
+}
+
+# Number of edges collected before they are converted to a numpy array.
+MATRIX_BATCH_SIZE = 65536
+
+# Aggregated edges are keyed by a single integer, source id in the upper bits.
+EDGE_KEY_SHIFT = 32
+EDGE_KEY_MASK = (1 << EDGE_KEY_SHIFT) - 1
+
 
 def add_to_mapping(mapping, index, addresses):
   """ Adds a list of addresses to the mapping.
@@ -51,48 +78,376 @@ def add_to_mapping(mapping, index, addresses):
   return index
 
 
-def parse_csv_to_unique_addresses(file):
+def parse_csv_to_unique_addresses(file, row_filter=None):
   """ Parses a csv file to a set of addresses. 
 
       Args:
         file: The filename of the csv file. Delimiter is comma and
               quotechar is doublequote. Schema of the CSV file given
               at the top of this file .
+        row_filter: None, or a function created by `make_row_filter()`, rows
+                    for which it returns false are skipped.
       Return:
         The set of addresses. """
   addresses = []
   with open(file, 'rb') as fp:
     reader = csv.reader(fp, delimiter=',', quotechar='"')
     for row in reader:
+      if row_filter is not None and not row_filter(row):
+        continue
       addresses.append(row[SOURCE])
       addresses.append(row[TARGET])
   return remove_duplicates(addresses)
 
 
-def process(mapping, file):
+def read_edges(mapping, file, row_filter=None):
+  """ Reads the input csv file and yields every edge anonymized using the passed mapping.
+      A row with multiple recipients yields one edge per recipient, a row without
+      recipients yields a single edge with target None.
+
+      Args:
+        mapping: The mapping to use. It is a hashmap with key being source email and value
+                 being the anonymized id.
+        file: The csv file to read. Structure is given at the top of this file.
+        row_filter: None, or a function created by `make_row_filter()`, rows for which it
+                    returns false are skipped. The rowid still counts all rows of the file.
+      Return:
+        A generator of 4-tuples consisting of rowid, source id, target id, time. """
+  with open(file, 'rb') as fp:
+    reader = csv.reader(fp, delimiter=',', quotechar='"')
+    rowid = 0
+    for row in reader:
+      rowid = rowid + 1
+      if row_filter is not None and not row_filter(row):
+        continue
+      s_addr_targets = split_address(row[TARGET])
+      for s_addr_source in split_address(row[SOURCE]):
+        # yield an edge with empty recipient if there are no recipients
+        if len(s_addr_targets) > 0:
+          for s_addr_target in s_addr_targets:
+            yield rowid, mapping[s_addr_source], mapping[s_addr_target], row[TIME]
+        else:
+          yield rowid, mapping[s_addr_source], None, row[TIME]
+
+
+def process(mapping, file, output_folder="anon", row_filter=None, adjacency=None):
   """ This function reads the input csv file and anonymizes it using the passed mapping.
 
       Args:
         mapping: The mapping to use. It is a hashmap with key being source email and value
                  being the anonymized id.
         file: The csv file to anonymize. Structure is given at the top of this file.
+        output_folder: The folder to write the anonymized file to.
+        row_filter: None, or a function created by `make_row_filter()`.
+        adjacency: None, or an `AdjacencyBuilder` to collect the edges for the sparse matrix.
       Return:
         Nothing. """
-  with open(file, 'rb') as fp:
-    with open(os.path.join("anon", file + ".anon.csv"), 'wb') as wp:
-      reader = csv.reader(fp, delimiter=',', quotechar='"')
-      writer = csv.writer(wp, delimiter=',', quotechar='"')
-      rowid = 0
-      for row in reader:
-        rowid = rowid + 1
-        for s_addr_source in split_address(row[1]):
-          s_addr_targets = split_address(row[2])
-          # write a row with empty recipients if there are no recipients
-          if len(s_addr_targets) > 0:
-            for s_addr_target in s_addr_targets:
-              writer.writerow([rowid, mapping[s_addr_source], mapping[s_addr_target], row[3]])
-          else:
-            writer.writerow([rowid, mapping[s_addr_source], "", row[3]])
+  edges = read_edges(mapping, file, row_filter)
+  if adjacency is not None:
+    edges = adjacency.collect(edges)
+  with open(os.path.join(output_folder, os.path.basename(file) + ".anon.csv"), 'wb') as wp:
+    writer = csv.writer(wp, delimiter=',', quotechar='"')
+    for rowid, source, target, time in edges:
+      writer.writerow([rowid, source, "" if target is None else target, time])
+
+
+def parse_time(timestr):
+  """ Parses a value of the TIME column into a datetime object. The known formats
+      are given in TIME_FORMATS at the top of this file.
+
+      Args:
+        timestr: The time string to parse.
+      Return:
+        The parsed datetime object. """
+  timestr = timestr.strip()
+  for time_format in TIME_FORMATS:
+    try:
+      return datetime.strptime(timestr, time_format)
+    except ValueError:
+      pass
+  raise ValueError("Not a time we can parse at this point: %s." % timestr)
+
+
+def format_time(timestr):
+  """ Normalizes a value of the TIME column to the first of TIME_FORMATS, which is sortable as
+      string. Values that are already in this format are not parsed.
+
+      Args:
+        timestr: The time string to normalize.
+      Return:
+        The normalized time string, or None if the time is empty or in an unknown format. """
+  timestr = timestr.strip()
+  if len(timestr) == 19 and timestr[4] == "-" and timestr[10] == " ":
+    return timestr
+  try:
+    return parse_time(timestr).strftime(TIME_FORMATS[0])
+  except ValueError:
+    return None
+
+
+def aggregate_edges(edges, period=None):
+  """ Aggregates edges into a weighted adjacency. For every (source, target) pair the
+      number of messages, the first and the last time, and optionally the number of
+      messages per period are accumulated. The pair is stored under a single integer
+      key, see `edge_key(source, target)`, and a missing target is stored as 0. The times
+      are kept as strings normalized by `format_time(timestr)`, once per row. Edges
+      without a known time are counted, but have no first or last time and no period.
+
+      Args:
+        edges: An iterable of 4-tuples consisting of rowid, source id, target id, time.
+        period: None, or one of the keys of PERIOD_LENGTHS to count messages per period.
+      Return:
+        A 2-tuple consisting of a dict with edge keys as keys and lists [count, first, last]
+        as values, with the dict of period counts appended if period is given, and the
+        number of edges without a known time. """
+  if period is not None and period not in PERIOD_LENGTHS:
+    raise ValueError("Unknown period: %s" % period)
+  aggregate = {}
+  untimed = 0
+  current_rowid, time = None, None
+  for rowid, source, target, timestr in edges:
+    # all edges of a row have the same time
+    if rowid != current_rowid:
+      current_rowid, time = rowid, format_time(timestr)
+    key = edge_key(source, target)
+    entry = aggregate.get(key)
+    if entry is None:
+      entry = [0, None, None] if period is None else [0, None, None, {}]
+      aggregate[key] = entry
+    entry[0] = entry[0] + 1
+    if time is None:
+      untimed = untimed + 1
+      continue
+    if entry[1] is None or time < entry[1]: entry[1] = time
+    if entry[2] is None or time > entry[2]: entry[2] = time
+    if period is not None:
+      bucket = time[:PERIOD_LENGTHS[period]]
+      entry[3][bucket] = entry[3].get(bucket, 0) + 1
+  return aggregate, untimed
+
+
+def edge_key(source, target):
+  """ Packs a (source, target) pair of anonymous ids into a single integer.
+
+      Args:
+        source: The anonymous id of the source.
+        target: The anonymous id of the target, or None if there is no target.
+      Return:
+        The integer key. """
+  if target is None:
+    target = 0
+  if source > EDGE_KEY_MASK or target > EDGE_KEY_MASK:
+    raise ValueError("Anonymous id too large for edge key: %d, %d" % (source, target))
+  return (source << EDGE_KEY_SHIFT) | target
+
+
+def split_edge_key(key):
+  """ Unpacks an integer key created by `edge_key(source, target)`.
+
+      Args:
+        key: The integer key.
+      Return:
+        A 2-tuple consisting of source id and target id, target id is None if there is no target. """
+  target = key & EDGE_KEY_MASK
+  return key >> EDGE_KEY_SHIFT, target if target != 0 else None
+
+
+def process_aggregated(mapping, file, period=None, output_folder="anon", row_filter=None, adjacency=None):
+  """ This function reads the input csv file, anonymizes it using the passed mapping and
+      writes the weighted edge list instead of the single edges. The structure of the
+      output is (without headers):
+      SOURCE,TARGET,COUNT,FIRST,LAST[,PERIODS]
+      where PERIODS is a semicolon separated list of period:count, e.g. 2015-01:3;2015-02:1.
+      FIRST and LAST are empty if no edge of the pair has a known time.
+
+      Args:
+        mapping: The mapping to use. It is a hashmap with key being source email and value
+                 being the anonymized id.
+        file: The csv file to anonymize. Structure is given at the top of this file.
+        period: None, or one of the keys of PERIOD_LENGTHS to count messages per period.
+        output_folder: The folder to write the weighted edge list to.
+        row_filter: None, or a function created by `make_row_filter()`.
+        adjacency: None, or an `AdjacencyBuilder` to collect the edges for the sparse matrix.
+      Return:
+        The number of edges without a known time. """
+  edges = read_edges(mapping, file, row_filter)
+  if adjacency is not None:
+    edges = adjacency.collect(edges)
+  aggregate, untimed = aggregate_edges(edges, period)
+  with open(os.path.join(output_folder, os.path.basename(file) + ".agg.csv"), 'wb') as wp:
+    writer = csv.writer(wp, delimiter=',', quotechar='"')
+    for key in sorted(aggregate):
+      source, target = split_edge_key(key)
+      entry = aggregate[key]
+      row = [source, "" if target is None else target, entry[0], entry[1] or "", entry[2] or ""]
+      if period is not None:
+        row.append(";".join("%s:%d" % kv for kv in sorted(entry[3].items())))
+      writer.writerow(row)
+  return untimed
+
+
+class AdjacencyBuilder(object):
+  """ Collects the edges of the anonymized communication network in batched numpy arrays while
+      the input files are processed, so that they can be exported as sparse matrix without
+      reading the files again. Requires numpy and scipy, which are imported when the builder is
+      created. """
+
+  def __init__(self):
+    """ Imports numpy and scipy and creates an empty builder. """
+    import numpy
+    import scipy.sparse
+    self.numpy = numpy
+    self.sparse = scipy.sparse
+    self.sources, self.targets = [], []
+    self.batch_sources = numpy.empty(MATRIX_BATCH_SIZE, dtype=numpy.int64)
+    self.batch_targets = numpy.empty(MATRIX_BATCH_SIZE, dtype=numpy.int64)
+    self.fill = 0
+
+  def collect(self, edges):
+    """ Adds the edges passing through to the batches, edges without recipients are skipped.
+
+        Args:
+          edges: An iterable of 4-tuples consisting of rowid, source id, target id, time.
+        Return:
+          A generator of the same edges. """
+    for edge in edges:
+      if edge[2] is not None:
+        self.batch_sources[self.fill] = edge[1]
+        self.batch_targets[self.fill] = edge[2]
+        self.fill = self.fill + 1
+        if self.fill == MATRIX_BATCH_SIZE:
+          self.sources.append(self.batch_sources.copy())
+          self.targets.append(self.batch_targets.copy())
+          self.fill = 0
+      yield edge
+
+  def to_matrix(self, dimension):
+    """ Builds the sparse matrix of the collected edges. The entry (source, target) is the
+        number of messages from source to target. The matrix is built in COO form and
+        converted to CSR form.
+
+        Args:
+          dimension: The number of rows and columns.
+        Return:
+          The CSR matrix. """
+    rows = self.numpy.concatenate(self.sources + [self.batch_sources[:self.fill]])
+    cols = self.numpy.concatenate(self.targets + [self.batch_targets[:self.fill]])
+    data = self.numpy.ones(len(rows), dtype=self.numpy.int64)
+    # duplicate entries are summed up in the conversion to CSR
+    return self.sparse.coo_matrix((data, (rows, cols)), shape=(dimension, dimension)).tocsr()
+
+
+def export_sparse_matrix(adjacency, mapping, filename):
+  """ Exports the anonymized communication network as a sparse sender x recipient matrix and
+      saves it as scipy .npz file in CSR form. Row and column indices are the anonymous ids,
+      therefore row and column 0 are always empty.
+
+      Args:
+        adjacency: The `AdjacencyBuilder` the edges were collected in.
+        mapping: The mapping used. It is a hashmap with key being source email and value
+                 being the anonymized id.
+        filename: The output filename.
+      Return:
+        The CSR matrix. """
+  dimension = max(mapping.values()) + 1 if len(mapping) > 0 else 1
+  matrix = adjacency.to_matrix(dimension)
+  adjacency.sparse.save_npz(filename, matrix)
+  return matrix
+
+
+def parse_address_patterns(patterns):
+  """ Normalizes the patterns of the address filter. A pattern is either a full address,
+      e.g. user@web.de, or a domain, e.g. web.de or @web.de.
+
+      Args:
+        patterns: The list of patterns.
+      Return:
+        A 2-tuple consisting of the set of addresses and the tuple of domains. """
+  addresses, domains = set(), []
+  for pattern in patterns:
+    pattern = pattern.strip().lower()
+    if pattern.startswith("@"):
+      domains.append(pattern[1:])
+    elif "@" in pattern:
+      addresses.add(pattern)
+    elif pattern != "":
+      domains.append(pattern)
+  return addresses, tuple(domains)
+
+
+def match_addresses(cells, addresses, domains):
+  """ Checks whether any address in the given address cells matches the address filter. First
+      the raw cells are checked for the patterns as substrings, only if one is found the cells
+      are split by `split_address(addr)` to confirm the match. A domain also matches its
+      subdomains.
+
+      Args:
+        cells: The list of raw address cells.
+        addresses: The set of addresses of the filter.
+        domains: The tuple of domains of the filter.
+      Return:
+        True if any address matches, otherwise false. """
+  raw = " ".join(cells).lower()
+  if not any(pattern in raw for pattern in addresses) and not any(domain in raw for domain in domains):
+    return False
+  subdomains = tuple("." + domain for domain in domains)
+  for cell in cells:
+    for addr in split_address(cell):
+      if addr in addresses:
+        return True
+      domain = addr.rpartition("@")[2]
+      if domain in domains or domain.endswith(subdomains):
+        return True
+  return False
+
+
+def make_row_filter(since=None, until=None, include=(), exclude=()):
+  """ Creates a filter for the rows of the input csv files. The filter is evaluated before the
+      addresses of a row are split, so excluded rows are skipped in both the mapping and the
+      anonymization pass. The cheap checks come first: the time range is compared as string
+      for times in the first of TIME_FORMATS, and address patterns are only confirmed by
+      splitting the addresses if they occur in the raw cells, see `match_addresses()`.
+
+      Args:
+        since: None, or the datetime from which on rows are kept, inclusive.
+        until: None, or the datetime up to which rows are kept, exclusive.
+        include: Address patterns, see `parse_address_patterns()`. If given, only rows with
+                 a matching source or target are kept.
+        exclude: Address patterns, rows with a matching source or target are skipped.
+      Return:
+        The filter function that takes a row and returns true if the row is kept, or None
+        if no filter is given. """
+  include_addresses, include_domains = parse_address_patterns(include)
+  exclude_addresses, exclude_domains = parse_address_patterns(exclude)
+  include = len(include_addresses) > 0 or len(include_domains) > 0
+  exclude = len(exclude_addresses) > 0 or len(exclude_domains) > 0
+  if since is None and until is None and not include and not exclude:
+    return None
+  since_str = since.strftime(TIME_FORMATS[0]) if since is not None else None
+  until_str = until.strftime(TIME_FORMATS[0]) if until is not None else None
+
+  def in_time_range(timestr):
+    timestr = timestr.strip()
+    if len(timestr) == 19 and timestr[4] == "-" and timestr[10] == " ":
+      # sortable as string
+      return (since_str is None or timestr >= since_str) and (until_str is None or timestr < until_str)
+    try:
+      time = parse_time(timestr)
+    except ValueError:
+      # rows without a known time are not in any time range
+      return False
+    return (since is None or time >= since) and (until is None or time < until)
+
+  def row_filter(row):
+    if (since is not None or until is not None) and not in_time_range(row[TIME]):
+      return False
+    if include and not match_addresses([row[SOURCE], row[TARGET]], include_addresses, include_domains):
+      return False
+    if exclude and match_addresses([row[SOURCE], row[TARGET]], exclude_addresses, exclude_domains):
+      return False
+    return True
+
+  return row_filter
 
 
 def repair_address(addr):
@@ -133,7 +488,9 @@ def check_special_addresses(addr):
 def split_address(addr):
   """ Takes a address value from the original input csv file and splits it into a set of
       single addresses, because each cell in the source csv file can contain multiple
-      addresses according to the email headers specification.
+      addresses according to the email headers specification. Cells that only consist of
+      plain addresses are split by `split_plain_address(addr)`, all other cells by the
+      email package in `split_address_stdlib(addr)`.
       
       Args:
         addr: The address cell to split into single addresses.
@@ -145,6 +502,45 @@ def split_address(addr):
   if ret:
     return {addr,}
 
+  addresses = split_plain_address(addr)
+  if addresses is None:
+    addresses = split_address_stdlib(addr)
+  return addresses
+
+
+def split_plain_address(addr):
+  """ Fast path of `split_address(addr)` for cells whose comma separated parts all match
+      PLAIN_ADDRESS, i.e. user@host or Name <user@host>. Such cells do not contain encoded
+      words, quotes, comments or groups, so splitting at commas yields the same addresses
+      as the email package.
+
+      Args:
+        addr: The address cell to split, already lowercased and stripped.
+
+      Return:
+        The list of single addresses, or None if the cell needs the email package. """
+  if addr == "":
+    return []
+  addresses = []
+  for part in addr.split(","):
+    # only ascii whitespace, the email package keeps other whitespace as a token
+    match = PLAIN_ADDRESS.fullmatch(part.strip(" \t"))
+    if match is None:
+      return None
+    addresses.append(match.group(1) or match.group(2))
+  return remove_duplicates(addresses)
+
+
+def split_address_stdlib(addr):
+  """ Splits an address cell with `email.utils.getaddresses` and decodes each address with
+      `email.header.decode_header`. This handles all cells, including encoded words, quoted
+      display names with commas and group syntax.
+
+      Args:
+        addr: The address cell to split, already lowercased and stripped.
+
+      Return:
+        The list of single addresses. """
   addresses = []
   for to in email.utils.getaddresses([addr,]):
     # first split the email addresses
@@ -181,31 +577,59 @@ def remove_duplicates(seq):
   return [x for x in seq if not (x in seen or seen_add(x))]
 
   
-def main():
+def main(aggregate=False, period=None, matrix=False, files=None, output_folder="anon", row_filter=None):
   """ The main function that runs this program. First a mapping is created over all input files that are
       captured via the *.csv glob filter. Then a directory called anon is created and each csv file is 
-      anonymized according to the mapping. The results are stored in the newly created folder. """
+      anonymized according to the mapping. The results are stored in the newly created folder, together
+      with the mapping as mapping.csv and as index for lookups in both directions as mapping.idx.
+
+      Args:
+        aggregate: If true, the weighted edge list is written instead of the single edges.
+        period: None, or one of the keys of PERIOD_LENGTHS to count messages per period
+                in the weighted edge list.
+        matrix: If true, the sparse sender x recipient matrix over all files is saved as well.
+        files: The list of csv files to anonymize, by default all *.csv files in the current directory.
+        output_folder: The folder to store the results in.
+        row_filter: None, or a function created by `make_row_filter()` to skip rows. """
+  # fail before processing the files if numpy or scipy are missing
+  adjacency = AdjacencyBuilder() if matrix else None
+
   index = 1
   mapping = {}
-  files = glob("*.csv")
+  if files is None:
+    files = glob("*.csv")
   for file in files:
-    index = add_to_mapping(mapping, index, parse_csv_to_unique_addresses(file))
+    index = add_to_mapping(mapping, index, parse_csv_to_unique_addresses(file, row_filter))
   print("mapped %d (%d) addresses." % (len(mapping), index-1))
 
-  if not os.path.isdir("anon"):
-    os.makedirs("anon")
+  if not os.path.isdir(output_folder):
+    os.makedirs(output_folder)
 
+  untimed = 0
   for file in files:
-    process(mapping, file)
+    if aggregate:
+      untimed = untimed + process_aggregated(mapping, file, period, output_folder, row_filter, adjacency)
+    else:
+      process(mapping, file, output_folder, row_filter, adjacency)
   print("processed %d files." % len(files))
+  if untimed > 0:
+    print("aggregated %d edges without a known time." % untimed)
 
-  with open(os.path.join("anon", "mapping.csv"), 'wb') as wp:
+  if matrix:
+    export_sparse_matrix(adjacency, mapping, os.path.join(output_folder, "adjacency.npz"))
+    print("saved matrix as %s" % os.path.join(output_folder, "adjacency.npz"))
+
+  with open(os.path.join(output_folder, "mapping.csv"), 'wb') as wp:
       writer = csv.writer(wp, delimiter=',', quotechar='"')
       for kv in mapping.items():
         writer.writerow(kv)
-  print("saved mapping as %s" % os.path.join("anon", "mapping.csv"))
+  print("saved mapping as %s" % os.path.join(output_folder, "mapping.csv"))
+
+  mapping_index.write_mapping_index(mapping, os.path.join(output_folder, "mapping.idx"))
+  print("saved mapping index as %s" % os.path.join(output_folder, "mapping.idx"))
 
 
 if __name__ == "__main__":
-  """ magic main. """
-  main()
+  """ magic main. The options are defined by the anonymize command of cli.py. """
+  import cli
+  cli.main(["anonymize"] + sys.argv[1:])
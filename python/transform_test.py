@@ -9,6 +9,8 @@ import os.path
 from glob import glob
 import unicodecsv as csv
 from io import BytesIO
+import random
+import shutil
 
 import transform
 
@@ -35,6 +37,159 @@ class TestTransformMethods(unittest.TestCase):
       self.assertEqual(addr, test_addr)
       self.assertFalse(ret)
 
+  def test_edge_key(self):
+    for source, target in [(1, 2), (2, 1), (1, None), (4294967295, 4294967295)]:
+      self.assertEqual(transform.split_edge_key(transform.edge_key(source, target)), (source, target))
+    self.assertNotEqual(transform.edge_key(1, 2), transform.edge_key(2, 1))
+    self.assertRaises(ValueError, transform.edge_key, 4294967296, 1)
+
+  def test_parse_time(self):
+    self.assertEqual(transform.parse_time("2015-01-06 19:28:01"), transform.datetime(2015, 1, 6, 19, 28, 1))
+    self.assertEqual(transform.parse_time("06.01.2015 19:28"), transform.datetime(2015, 1, 6, 19, 28))
+    self.assertRaises(ValueError, transform.parse_time, "Jan 06, 2015")
+
+  def test_format_time(self):
+    self.assertEqual(transform.format_time(" 2015-01-06 19:28:01 "), "2015-01-06 19:28:01")
+    self.assertEqual(transform.format_time("06.01.2015 19:28"), "2015-01-06 19:28:00")
+    self.assertIsNone(transform.format_time(""))
+    self.assertIsNone(transform.format_time("Tue, 06 Jan 2015 19:28:01 +0100"))
+
+  def test_aggregate_edges(self):
+    edges = [(1, 1, 2, "2015-01-06 19:28:00"), (2, 1, 2, "31.12.2014 04:57"), (2, 1, 3, "31.12.2014 04:57"),
+             (3, 1, 2, "2015-02-01 10:00:00"), (4, 3, None, "2015-02-01 10:00:00"), (5, 1, 2, ""), (6, 4, 2, "")]
+    aggregate, untimed = transform.aggregate_edges(edges, "month")
+    self.assertEqual(len(aggregate), 4)
+    self.assertEqual(untimed, 2)
+    self.assertEqual(aggregate[transform.edge_key(1, 2)], [4, "2014-12-31 04:57:00", "2015-02-01 10:00:00", {"2014-12": 1, "2015-01": 1, "2015-02": 1}])
+    self.assertEqual(aggregate[transform.edge_key(3, None)][0], 1)
+    self.assertEqual(aggregate[transform.edge_key(4, 2)], [1, None, None, {}])
+    self.assertEqual(transform.aggregate_edges(edges)[0][transform.edge_key(1, 2)], [4, "2014-12-31 04:57:00", "2015-02-01 10:00:00"])
+    self.assertRaises(ValueError, transform.aggregate_edges, edges, "week")
+
+  def test_process_aggregated(self):
+    testcsv = '''"a","x@y.de","p@q.de, r@s.de",2015-01-01 10:00:00
+"b","x@y.de","p@q.de",01.02.2015 10:00
+"c","p@q.de","",
+"d","x@y.de","p@q.de","Sun, 01 Mar 2015 10:00:00 +0100"
+'''
+    try:
+      with open("transform_test_agg.csv.temp", "w") as fp:
+        fp.write(testcsv)
+      os.makedirs("transform_test_agg.temp")
+      mapping = {}
+      transform.add_to_mapping(mapping, 1, transform.parse_csv_to_unique_addresses("transform_test_agg.csv.temp"))
+      self.assertEqual(transform.process_aggregated(mapping, "transform_test_agg.csv.temp", "month", "transform_test_agg.temp"), 2)
+      with open(os.path.join("transform_test_agg.temp", "transform_test_agg.csv.temp.agg.csv"), "rb") as fp:
+        rows = list(csv.reader(fp, delimiter=',', quotechar='"'))
+      self.assertEqual(rows, [
+        [str(mapping["x@y.de"]), str(mapping["p@q.de"]), "3", "2015-01-01 10:00:00", "2015-02-01 10:00:00", "2015-01:1;2015-02:1"],
+        [str(mapping["x@y.de"]), str(mapping["r@s.de"]), "1", "2015-01-01 10:00:00", "2015-01-01 10:00:00", "2015-01:1"],
+        [str(mapping["p@q.de"]), "", "1", "", "", ""],
+      ])
+    finally:
+      if os.path.exists("transform_test_agg.csv.temp"):
+        os.remove("transform_test_agg.csv.temp")
+      if os.path.isdir("transform_test_agg.temp"):
+        shutil.rmtree("transform_test_agg.temp")
+
+  def test_export_sparse_matrix(self):
+    try:
+      import scipy.sparse
+    except ImportError:
+      self.skipTest("scipy is not installed")
+    testcsv = '''"a","x@y.de","p@q.de, r@s.de",2015-01-01 10:00:00
+"b","x@y.de","p@q.de",2015-02-01 10:00:00
+"c","p@q.de","",2015-02-01 10:00:00
+'''
+    try:
+      with open("transform_test_matrix.csv.temp", "w") as fp:
+        fp.write(testcsv)
+      mapping = {}
+      transform.add_to_mapping(mapping, 1, transform.parse_csv_to_unique_addresses("transform_test_matrix.csv.temp"))
+      batch_size = transform.MATRIX_BATCH_SIZE
+      try:
+        # edges are collected across several batches
+        transform.MATRIX_BATCH_SIZE = 2
+        adjacency = transform.AdjacencyBuilder()
+        edges = list(transform.read_edges(mapping, "transform_test_matrix.csv.temp"))
+        # the edges pass through unchanged
+        self.assertEqual(list(adjacency.collect(edges)), edges)
+      finally:
+        transform.MATRIX_BATCH_SIZE = batch_size
+      matrix = transform.export_sparse_matrix(adjacency, mapping, "transform_test_matrix.npz.temp.npz")
+      self.assertEqual(matrix.shape, (4, 4))
+      self.assertEqual(matrix[mapping["x@y.de"], mapping["p@q.de"]], 2)
+      self.assertEqual(matrix[mapping["x@y.de"], mapping["r@s.de"]], 1)
+      self.assertEqual(matrix.sum(), 3)
+      self.assertEqual((scipy.sparse.load_npz("transform_test_matrix.npz.temp.npz") != matrix).nnz, 0)
+    finally:
+      for temp in ("transform_test_matrix.csv.temp", "transform_test_matrix.npz.temp.npz"):
+        if os.path.exists(temp):
+          os.remove(temp)
+
+  def test_split_address_differential(self):
+    # the fast path must split exactly like the email package, compared on a fuzzed corpus
+    def reference(addr):
+      addr, ret = transform.check_special_addresses(addr)
+      return {addr,} if ret else transform.split_address_stdlib(addr)
+
+    def result(split, addr):
+      try:
+        return split(addr)
+      except Exception as e:
+        return type(e)
+
+    rng = random.Random(4711)
+    names = ["", "User", "Dr. Who", "O'Brien", "Grüße Name", "x-y_z", ".", "Mann, User", "\"Mann, User\"", "=?UTF-8?Q?Marcel_H=C3=BCkker?=", "(comment)", "grp:", "a;b"]
+    locals = ["user", "User.Name", "a..b", ".a", "x+tag", "a-b_c", "grüße", "o'brien", "\"q\"", "u=?x?=", "a b", ""]
+    domains = ["web.de", "b", ".de", "x-y.de", "web.de.", "WEB.DE", "[1.2.3.4]", "", "ü.de"]
+    alphabet = "abZ09.@<> ,-_+'\"=?:;()\\ü\t\xa0[]"
+    fast = 0
+    for i in range(10000):
+      if i % 2:
+        addr = "".join(rng.choice(alphabet) for _ in range(rng.randrange(0, 25)))
+      else:
+        addr = rng.choice([",", ", ", " ; ", "\xa0,", ",\xa0"]).join(rng.choice(["%s%s@%s", "%s <%s@%s>", "%s<%s@%s>"]) % (rng.choice(names), rng.choice(locals), rng.choice(domains)) \
+          for _ in range(rng.randrange(1, 4)))
+      if transform.split_plain_address(transform.check_special_addresses(addr)[0]) is not None:
+        fast = fast + 1
+      self.assertEqual(result(transform.split_address, addr), result(reference, addr), addr)
+    # non-ascii whitespace is a token for the email package
+    addr = "Name <x@y.de>\xa0,A.B <c@d>"
+    self.assertEqual(transform.split_address(addr), reference(addr))
+    # make sure the fast path is actually exercised
+    self.assertGreater(fast, 400)
+
+  def test_make_row_filter(self):
+    self.assertIsNone(transform.make_row_filter())
+    rows = [
+      ["a", "user@web.de", "Other <other@gmx.de>", "2015-01-06 19:28:00"],
+      ["b", "\"Mann, User\" <user@mail.web.de>", "x@y.de", "31.12.2014 04:57"],
+      ["c", "notweb.de@y.de", "Web.de Team <team@y.de>", "2015-02-01 10:00:00"],
+      ["d", "x@y.de", "", ""],
+    ]
+    def kept(**kwargs):
+      row_filter = transform.make_row_filter(**kwargs)
+      return [row[0] for row in rows if row_filter(row)]
+
+    self.assertEqual(kept(since=transform.datetime(2015, 1, 1)), ["a", "c"])
+    self.assertEqual(kept(until=transform.datetime(2015, 1, 1)), ["b"])
+    self.assertEqual(kept(since=transform.datetime(2014, 12, 31, 4, 57), until=transform.datetime(2015, 2, 1, 10)), ["a", "b"])
+    self.assertEqual(kept(include=["web.de"]), ["a", "b"])
+    self.assertEqual(kept(include=["@WEB.de", "x@y.de"]), ["a", "b", "d"])
+    self.assertEqual(kept(include=["mail.web.de"]), ["b"])
+    self.assertEqual(kept(exclude=["gmx.de", "notweb.de@y.de"]), ["b", "d"])
+    self.assertEqual(kept(since=transform.datetime(2015, 1, 1), exclude=["web.de"]), ["c"])
+
+    # rows without the pattern in the raw cells are never split
+    split_address = transform.split_address
+    try:
+      transform.split_address = None
+      self.assertFalse(transform.make_row_filter(include=["gmx.net"])(rows[0]))
+      self.assertTrue(transform.make_row_filter(exclude=["gmx.net"])(rows[0]))
+    finally:
+      transform.split_address = split_address
+
   def test_integration(self):
     testcsv = ''' "Comunio.de Aktivitaetserinnerung","mailbot@comunio.de","user@web.de",31.12.2014 04:57, 
 "Test Good news, Here YouCan Get ExclusiveTablet  :-)","Darrell <du@prosegarden.net>","user@web.de",04.01.2015 23:07, 